@@ -1,60 +1,147 @@
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
-from estimators import SampleAverageEstimator, WeightedEstimator
-from testbed import K_armed_testbed
-
-np.random.seed(250)
-
-
-def plot_performance(estimator_names, rewards, action_optimality):
-    for i, estimator_name in enumerate(estimator_names):
-        average_run_rewards = np.average(rewards[i], axis=0)
-        plt.plot(average_run_rewards, label=estimator_name)
-
+from accumulators import CurveAccumulator, DecimatedCurve, DEFAULT_N_BUCKETS
+from adaptive import have_converged, run_until_converged
+from cache import ResultCache
+from estimators import BatchedSampleAverageEstimator, BatchedWeightedEstimator
+from testbed import Batched_K_armed_testbed
+
+
+def plot_curves(estimator_names, curves):
+    # curves are DecimatedCurves: the line is the per-bucket mean, the light band spans the bucket's
+    # min to max (what a line through every step would cover) and the darker band the confidence interval
+    for estimator_name, curve in zip(estimator_names, curves):
+        confidence_interval = curve.confidence_interval()
+        line, = plt.plot(curve.steps, curve.mean, label=estimator_name)
+        plt.fill_between(curve.steps, curve.minimum, curve.maximum, color=line.get_color(), alpha=0.15)
+        plt.fill_between(curve.steps, curve.mean - confidence_interval, curve.mean + confidence_interval,
+                         color=line.get_color(), alpha=0.3)
+
+
+def plot_performance(estimator_names, reward_curves, optimality_curves):
+    plot_curves(estimator_names, reward_curves)
     plt.legend()
     plt.xlabel("Steps")
     plt.ylabel("Average reward")
     plt.show()
 
-    for i, estimator_name in enumerate(estimator_names):
-        average_run_optimality = np.average(action_optimality[i], axis=0)
-        plt.plot(average_run_optimality, label=estimator_name)
+    plot_curves(estimator_names, optimality_curves)
     plt.legend()
     plt.xlabel("Steps")
     plt.ylabel("% Optimal action")
     plt.show()
 
 
-if __name__ == "__main__":
-    K = 10
-    N_STEPS = 10000
-    N_RUNS = 2000
-    N_ESTIMATORS = 2
+def create_curve(n_steps, n_buckets=None):
+    return CurveAccumulator(n_steps) if n_buckets is None else DecimatedCurve(n_steps, n_buckets)
+
+
+def simulate(k, n_steps, n_runs, common_random_numbers=False, n_buckets=None):
+    # averaged learning curves (with variance across runs) instead of dense (estimators, runs, steps) arrays;
+    # with n_buckets, DecimatedCurves of that many points are filled instead of full-resolution CurveAccumulators
+    testbed = Batched_K_armed_testbed(n_runs=n_runs, k_actions=k, common_random_numbers=common_random_numbers)
 
-    rewards = np.full((N_ESTIMATORS, N_RUNS, N_STEPS), fill_value=0.)
-    optimal_selections = np.full((N_ESTIMATORS, N_RUNS, N_STEPS), fill_value=0.)
+    action_value_estimates = np.full((n_runs, k), fill_value=0.0)
+    sample_average_estimator = BatchedSampleAverageEstimator(action_value_estimates.copy(), epsilon=0.1)
+    weighted_estimator = BatchedWeightedEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=0.1)
 
-    for run_i in tqdm(range(N_RUNS)):
+    estimators = [sample_average_estimator, weighted_estimator]
 
-        testbed = K_armed_testbed(k_actions=K)
+    reward_curves = [create_curve(n_steps, n_buckets) for _ in estimators]
+    optimality_curves = [create_curve(n_steps, n_buckets) for _ in estimators]
 
-        action_value_estimates = np.full(K, fill_value=0.0)
-        sample_average_estimator = SampleAverageEstimator(action_value_estimates.copy(), epsilon=0.1)
-        weighted_estimator = WeightedEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=0.1)
+    for step_i in tqdm(range(n_steps)):
+        for estimator_i, estimator in enumerate(estimators):
+            actions_selected = estimator.select_action()
+            is_optimal = testbed.is_optimal_action(actions_selected)
+            reward = testbed.sample_action(actions_selected)
+            estimator.update_estimates(actions_selected, reward)
 
-        estimators = [sample_average_estimator, weighted_estimator]
+            reward_curves[estimator_i].update(step_i, reward)
+            optimality_curves[estimator_i].update(step_i, is_optimal)
 
-        for step_i in range(N_STEPS):
-            for estimator_i, estimator in enumerate(estimators):
-                action_selected = estimator.select_action()
-                is_optimal = testbed.is_optimal_action(action_selected)
-                reward = testbed.sample_action(action_selected)
-                estimator.update_estimates(action_selected, reward)
+        testbed.random_walk_action_values()
 
-                rewards[estimator_i][run_i][step_i] = reward
-                optimal_selections[estimator_i][run_i][step_i] = is_optimal
+    return reward_curves, optimality_curves
 
-            testbed.random_walk_action_values()
 
-    plot_performance(["Ɛ=0.1", "Ɛ=0.1 α=0.1"], np.array(rewards), np.array(optimal_selections))
+def curves_to_arrays(prefix, curves):
+    states = [curve.get_state() for curve in curves]
+    return {prefix + "_" + name: np.array([state[name] for state in states]) for name in states[0]}
+
+
+def curves_from_arrays(prefix, arrays):
+    names = [name[len(prefix) + 1:] for name in arrays if name.startswith(prefix + "_")]
+    curves = []
+    for values in zip(*[arrays[prefix + "_" + name] for name in names]):
+        curve = DecimatedCurve(0)
+        curve.set_state(**dict(zip(names, values)))
+        curves.append(curve)
+    return curves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-dir", default="cache",
+                        help="directory of the result cache; an experiment computed before is loaded from it")
+    parser.add_argument("--no-cache", action="store_true", help="recompute and don't store results")
+    parser.add_argument("--common-random-numbers", action="store_true",
+                        help="give both estimators the same reward noise for the same (step, action)")
+    parser.add_argument("--target-ci-width", type=float, default=None,
+                        help="adaptive mode: add runs until, at every step, the 95%% confidence interval of every "
+                             "estimator's curve (see --ci-metric) is narrower than this")
+    parser.add_argument("--ci-metric", choices=["reward", "optimality"], default="reward",
+                        help="adaptive mode: average reward or %% optimal action")
+    parser.add_argument("--batch-runs", type=int, default=200, help="adaptive mode: runs added per batch")
+    parser.add_argument("--max-runs", type=int, default=10000, help="adaptive mode: most runs")
+    parser.add_argument("--points", type=int, default=DEFAULT_N_BUCKETS,
+                        help="points per plotted (and stored) curve; every point summarizes a bucket of steps")
+    args = parser.parse_args()
+
+    K = 10
+    N_STEPS = 10000
+    N_RUNS = 2000
+    SEED = 250
+
+    description = {
+        "simulation": "Exercise 2.5",
+        "estimators": ["BatchedSampleAverageEstimator(epsilon=0.1)",
+                       "BatchedWeightedEstimator(epsilon=0.1, alpha=0.1)"],
+        "k": K,
+        "n_steps": N_STEPS,
+        "n_runs": N_RUNS,
+        "seed": SEED,
+        "common_random_numbers": args.common_random_numbers,
+        "n_buckets": args.points
+    }
+    if args.target_ci_width is not None:
+        description["n_runs"] = {"target_ci_width": args.target_ci_width, "ci_metric": args.ci_metric,
+                                 "batch_runs": args.batch_runs, "max_runs": args.max_runs}
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    cached_arrays = None if cache is None else cache.load(description)
+
+    if cached_arrays is not None:
+        reward_curves = curves_from_arrays("reward", cached_arrays)
+        optimality_curves = curves_from_arrays("optimality", cached_arrays)
+    else:
+        np.random.seed(SEED)
+        if args.target_ci_width is None:
+            reward_curves, optimality_curves = simulate(K, N_STEPS, N_RUNS, args.common_random_numbers, args.points)
+        else:
+            n_estimators = 2
+            monitored_curves = slice(0, n_estimators) if args.ci_metric == "reward" else slice(n_estimators, None)
+            curves, n_runs = run_until_converged(
+                lambda first_run_i, n_runs: sum(simulate(K, N_STEPS, n_runs, args.common_random_numbers), []),
+                lambda curves: have_converged(curves[monitored_curves], args.target_ci_width),
+                args.batch_runs, args.max_runs)
+            # runs are added batch by batch at full resolution, then decimated
+            curves = [DecimatedCurve.from_curve(curve, args.points) for curve in curves]
+            reward_curves, optimality_curves = curves[:n_estimators], curves[n_estimators:]
+            print("%d runs" % n_runs)
+        if cache is not None:
+            cache.save(description, **curves_to_arrays("reward", reward_curves),
+                       **curves_to_arrays("optimality", optimality_curves))
+
+    plot_performance(["Ɛ=0.1", "Ɛ=0.1 α=0.1"], reward_curves, optimality_curves)
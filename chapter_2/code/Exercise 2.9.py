@@ -1,22 +1,29 @@
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+from functools import partial
+from accumulators import RunningMean
+from cache import ResultCache
+from checkpoint import load_checkpoint, save_checkpoint
 from tqdm import tqdm
-from testbed import K_armed_testbed
+from testbed import K_armed_testbed, Batched_K_armed_testbed
 from estimators import SampleAverageEstimator, WeightedEstimator, GradientBandit, UCBEstimator
-
-np.random.seed(250)
+from estimators import BatchedSampleAverageEstimator, BatchedWeightedEstimator, BatchedGradientBandit, \
+    BatchedUCBEstimator
+from shards import parse_shard, check_shard, save_shard, merge_shards
+from sweep import run_sweep, run_adaptive_sweep, run_batched_sweep
 
 
 def plot_performance_of_parameter_settings(parameter_settings, estimator_names, performance_results):
+    # performance_results holds one accumulator of per-estimator results across runs per parameter setting
+    for estimator_i, estimator_name in enumerate(estimator_names):
+        average_parameter_results = np.array([accumulator.mean[estimator_i] for accumulator in performance_results])
+        confidence_intervals = np.array([accumulator.confidence_interval()[estimator_i]
+                                         for accumulator in performance_results])
 
-    for estimator_i, estimator_results in enumerate(performance_results):
-        average_parameter_results = []
-        for parameter_setting_results in estimator_results:
-            average_run_results = np.average(parameter_setting_results, axis=0)
-            average_step_rewards = np.average(average_run_results)
-            average_parameter_results.append(average_step_rewards)
-
-        plt.plot(parameter_settings, average_parameter_results, label=estimator_names[estimator_i])
+        plt.plot(parameter_settings, average_parameter_results, label=estimator_name)
+        plt.fill_between(parameter_settings, average_parameter_results - confidence_intervals,
+                         average_parameter_results + confidence_intervals, alpha=0.3)
 
     plt.legend()
     plt.xlabel("ε, α, c, Q0")
@@ -25,44 +32,190 @@ def plot_performance_of_parameter_settings(parameter_settings, estimator_names,
     plt.show()
 
 
+def simulate_cell(parameter_setting, random_state, k, n_steps, average_over_last_n_steps, common_random_numbers=False,
+                  checkpoint_path=None, checkpoint_every_n_steps=50000):
+    # one run of all estimators for one parameter setting; returns each estimator's
+    # average reward over the last average_over_last_n_steps steps.
+    # With a checkpoint_path, the state is saved every checkpoint_every_n_steps steps, and a run
+    # that finds a checkpoint continues from it instead of starting over
+    starting_index = n_steps - average_over_last_n_steps
+
+    state = None if checkpoint_path is None else load_checkpoint(checkpoint_path)
+    if state is None:
+        testbed = K_armed_testbed(k_actions=k, random_state=random_state, common_random_numbers=common_random_numbers)
+
+        action_value_estimates = np.full(k, fill_value=0.0)
+        sample_average_estimator = SampleAverageEstimator(action_value_estimates.copy(), epsilon=parameter_setting,
+                                                          random_state=random_state)
+        weighted_estimator = WeightedEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=parameter_setting,
+                                               random_state=random_state)
+        ucb = UCBEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=0.1, c=parameter_setting,
+                           random_state=random_state)
+        gradient_bandit = GradientBandit(action_value_estimates.copy(), alpha=parameter_setting,
+                                         random_state=random_state)
+
+        estimators = [sample_average_estimator, weighted_estimator, ucb, gradient_bandit]
+        average_rewards = RunningMean(shape=len(estimators))
+        first_step_i = 0
+    else:
+        testbed, estimators, average_rewards = state["testbed"], state["estimators"], state["average_rewards"]
+        first_step_i = state["step_i"]
+
+    step_rewards = np.full(len(estimators), fill_value=0.)
+
+    for step_i in range(first_step_i, n_steps):
+        if checkpoint_path is not None and step_i > first_step_i and step_i % checkpoint_every_n_steps == 0:
+            # testbed and estimators share the RandomState, so its state is saved along with them
+            save_checkpoint(checkpoint_path, {"testbed": testbed, "estimators": estimators,
+                                              "average_rewards": average_rewards, "step_i": step_i})
+
+        for estimator_i, estimator in enumerate(estimators):
+            action_selected = estimator.select_action()
+            reward = testbed.sample_action(action_selected)
+            estimator.update_estimates(action_selected, reward)
+            step_rewards[estimator_i] = reward
+
+        if step_i >= starting_index:
+            average_rewards.update(step_rewards)
+
+        testbed.random_walk_action_values()
+
+    # a diverged estimator's rewards are meaningless (see GradientBandit)
+    return np.where([estimator.diverged for estimator in estimators], np.nan, average_rewards.mean)
+
+
+def simulate_batch(run_parameters, random_state, k, n_steps, average_over_last_n_steps, common_random_numbers=False):
+    # all estimators for all (parameter setting, run) rows at once, each row with its own parameter value;
+    # returns each estimator's average reward over the last average_over_last_n_steps steps, per row
+    starting_index = n_steps - average_over_last_n_steps
+    n_runs = len(run_parameters)
+
+    testbed = Batched_K_armed_testbed(n_runs=n_runs, k_actions=k, random_state=random_state,
+                                      common_random_numbers=common_random_numbers)
+
+    action_value_estimates = np.full((n_runs, k), fill_value=0.0)
+    sample_average_estimator = BatchedSampleAverageEstimator(action_value_estimates.copy(), epsilon=run_parameters,
+                                                             random_state=random_state)
+    weighted_estimator = BatchedWeightedEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=run_parameters,
+                                                  random_state=random_state)
+    ucb = BatchedUCBEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=0.1, c=run_parameters,
+                              random_state=random_state)
+    gradient_bandit = BatchedGradientBandit(action_value_estimates.copy(), alpha=run_parameters,
+                                            random_state=random_state)
+
+    estimators = [sample_average_estimator, weighted_estimator, ucb, gradient_bandit]
+    average_rewards = RunningMean(shape=(len(estimators), n_runs))
+    step_rewards = np.full((len(estimators), n_runs), fill_value=0.)
+
+    for step_i in tqdm(range(n_steps)):
+        for estimator_i, estimator in enumerate(estimators):
+            actions_selected = estimator.select_action()
+            reward = testbed.sample_action(actions_selected)
+            estimator.update_estimates(actions_selected, reward)
+            step_rewards[estimator_i] = reward
+
+        if step_i >= starting_index:
+            average_rewards.update(step_rewards)
+
+        testbed.random_walk_action_values()
+
+    # a diverged run's rewards are meaningless (see BatchedGradientBandit)
+    return np.where([estimator.diverged for estimator in estimators], np.nan, average_rewards.mean)
+
+
 if __name__ == "__main__":
-    with open("runs.csv", "w+") as csvfile:
-        csvfile.write("algorithm_id,parameter_setting,run_i\n")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=250,
+                        help="root seed every (parameter setting, run) seed derives from")
+    parser.add_argument("--batched", action="store_true",
+                        help="simulate all parameter settings and runs as one batch in a single process "
+                             "(one RNG stream for the whole batch instead of one per cell); always recomputes all "
+                             "cells, without cache or checkpoints")
+    parser.add_argument("--common-random-numbers", action="store_true",
+                        help="give all estimators of a run the same reward noise for the same (step, action)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the result cache; cells computed before are loaded from it "
+                             "(default: cache)")
+    parser.add_argument("--no-cache", action="store_true", help="recompute all cells and don't store results")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="directory to periodically save unfinished cells to; an interrupted sweep run again "
+                             "with the same options resumes from there")
+    parser.add_argument("--checkpoint-every", type=int, default=50000, help="steps between checkpoints of a cell")
+    parser.add_argument("--target-ci-width", type=float, default=None,
+                        help="adaptive mode: add runs per parameter setting until the 95%% confidence interval of "
+                             "every estimator's average reward is narrower than this")
+    parser.add_argument("--batch-runs", type=int, default=10, help="adaptive mode: runs added per batch")
+    parser.add_argument("--max-runs", type=int, default=100, help="adaptive mode: most runs per parameter setting")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="i/N: only simulate shard i (from 1) of N of the cells and save its partial results "
+                             "to --shard-file instead of plotting")
+    parser.add_argument("--shard-file", default=None, help="shard mode: output file (default: shard_i_of_N.npz)")
+    parser.add_argument("--merge", nargs="+", default=None, metavar="SHARD_FILE",
+                        help="plot the merged results of shard files instead of simulating")
+    args = parser.parse_args()
+    if args.shard is not None and (args.batched or args.target_ci_width is not None):
+        parser.error("--shard splits the fixed-runs sweep and can't be combined with --batched or --target-ci-width")
+    if args.batched and (args.checkpoint_dir is not None or args.cache_dir is not None):
+        parser.error("--batched simulates the whole sweep at once and can't be combined with --checkpoint-dir "
+                     "or --cache-dir")
+
     K = 10
     N_STEPS = 200000
     N_RUNS = 10
-    N_ESTIMATORS = 4
     AVERAGE_OVER_LAST_N_STEPS = 100000
 
-    starting_index = N_STEPS - AVERAGE_OVER_LAST_N_STEPS
-
     parameter_settings = [1.0/128, 1.0/64, 1.0/32, 1.0/16, 1.0/8, 1.0/4, 1.0/2, 1.0, 2.0, 4.0]
-
-    rewards = np.full((N_ESTIMATORS, len(parameter_settings), N_RUNS, AVERAGE_OVER_LAST_N_STEPS), fill_value=0.)
-
-    for parameter_setting_i, parameter_setting in tqdm(enumerate(parameter_settings), total=len(parameter_settings)):
-        for run_i in tqdm(range(N_RUNS)):
-
-            testbed = K_armed_testbed(k_actions=K)
-
-            action_value_estimates = np.full(K, fill_value=0.0)
-            sample_average_estimator = SampleAverageEstimator(action_value_estimates.copy(), epsilon=parameter_setting)
-            weighted_estimator = WeightedEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=parameter_setting)
-            ucb = UCBEstimator(action_value_estimates.copy(), epsilon=0.1, alpha=0.1, c=parameter_setting)
-            gradient_bandit = GradientBandit(action_value_estimates.copy(), alpha=parameter_setting)
-
-            estimators = [sample_average_estimator, weighted_estimator, ucb, gradient_bandit]
-
-            for step_i in tqdm(range(N_STEPS)):
-                for estimator_i, estimator in enumerate(estimators):
-                    action_selected = estimator.select_action()
-                    reward = testbed.sample_action(action_selected)
-                    estimator.update_estimates(action_selected, reward)
-
-                    if step_i >= starting_index:
-                        rewards[estimator_i][parameter_setting_i][run_i][step_i - starting_index] = reward
-
-                testbed.random_walk_action_values()
-
-    estimator_names = ["Sample Average Estimator", "Constant Step-size Estimator", "UCB", "Gradient Bandit"]
-    plot_performance_of_parameter_settings(parameter_settings, estimator_names, rewards)
+    if args.shard is not None:
+        try:
+            check_shard(args.shard, len(parameter_settings) * N_RUNS)
+        except ValueError as error:
+            parser.error(str(error))
+
+    # everything a cell's results depend on besides parameter setting, seed and run index (p = parameter setting)
+    cell_description = {
+        "simulation": "Exercise 2.9",
+        "estimators": ["SampleAverageEstimator(epsilon=p)", "WeightedEstimator(epsilon=0.1, alpha=p)",
+                       "UCBEstimator(epsilon=0.1, alpha=0.1, c=p)", "GradientBandit(alpha=p)"],
+        "k": K,
+        "n_steps": N_STEPS,
+        "average_over_last_n_steps": AVERAGE_OVER_LAST_N_STEPS,
+        "common_random_numbers": args.common_random_numbers
+    }
+    cache = None if args.no_cache else ResultCache(args.cache_dir or "cache")
+    # the sweep as a whole, which shard files must agree on to be merged
+    sweep_description = dict(cell_description, n_runs=N_RUNS, root_seed=args.seed)
+
+    # rewards holds, per parameter setting, the runs' average rewards over the last steps (per estimator)
+    if args.merge is not None:
+        description, parameter_settings, rewards, _ = merge_shards(args.merge)
+        if description != sweep_description:
+            parser.error("the shard files are of a different sweep: %s" % description)
+    elif args.batched:
+        rewards = run_batched_sweep(
+            partial(simulate_batch, k=K, n_steps=N_STEPS, average_over_last_n_steps=AVERAGE_OVER_LAST_N_STEPS,
+                    common_random_numbers=args.common_random_numbers),
+            parameter_settings, N_RUNS, root_seed=args.seed)
+    elif args.target_ci_width is not None:
+        rewards, n_runs = run_adaptive_sweep(
+            partial(simulate_cell, k=K, n_steps=N_STEPS, average_over_last_n_steps=AVERAGE_OVER_LAST_N_STEPS,
+                    common_random_numbers=args.common_random_numbers, checkpoint_every_n_steps=args.checkpoint_every),
+            parameter_settings, args.target_ci_width, args.batch_runs, args.max_runs, root_seed=args.seed,
+            n_workers=args.workers, cache=cache, cell_description=cell_description, checkpoint_dir=args.checkpoint_dir)
+        for parameter_setting, parameter_setting_n_runs in zip(parameter_settings, n_runs):
+            print("parameter setting %g: %d runs" % (parameter_setting, parameter_setting_n_runs))
+    else:
+        rewards = run_sweep(
+            partial(simulate_cell, k=K, n_steps=N_STEPS, average_over_last_n_steps=AVERAGE_OVER_LAST_N_STEPS,
+                    common_random_numbers=args.common_random_numbers, checkpoint_every_n_steps=args.checkpoint_every),
+            parameter_settings, N_RUNS, root_seed=args.seed, n_workers=args.workers,
+            cache=cache, cell_description=cell_description, checkpoint_dir=args.checkpoint_dir, shard=args.shard)
+
+    if args.shard is not None:
+        shard_i, n_shards = args.shard
+        shard_file = args.shard_file or "shard_%d_of_%d.npz" % (shard_i + 1, n_shards)
+        save_shard(shard_file, sweep_description, parameter_settings, rewards, [shard_i], n_shards)
+        print("saved shard %d of %d to %s" % (shard_i + 1, n_shards, shard_file))
+    else:
+        estimator_names = ["Sample Average Estimator", "Constant Step-size Estimator", "UCB", "Gradient Bandit"]
+        plot_performance_of_parameter_settings(parameter_settings, estimator_names, rewards)
@@ -0,0 +1,172 @@
+import numpy as np
+
+
+def combine_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    # Chan et al.'s pairwise update: merges (count, mean, sum of squared deviations) of two sample sets
+    count = count_a + count_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = mean_b - mean_a
+        mean = np.where(count > 0, mean_a + delta * count_b / count, 0.)
+        m2 = np.where(count > 0, m2_a + m2_b + delta ** 2 * count_a * count_b / count, 0.)
+    return count, mean, m2
+
+
+def batch_moments(values):
+    # (count, mean, sum of squared deviations) of a batch of samples stacked along axis 0
+    values = np.asarray(values, dtype=float)
+    mean = np.mean(values, axis=0)
+    return len(values), mean, np.sum((values - mean) ** 2, axis=0)
+
+
+class RunningMean(object):
+    # incremental sample average, Q_n+1 = Q_n + 1/n * (R_n - Q_n), of a scalar or of a fixed-shape array
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.full(shape, fill_value=0.)
+
+    def update(self, value):
+        self.count += 1
+        self.mean = self.mean + (1.0 / self.count) * (value - self.mean)
+
+
+class MomentAccumulator(object):
+    # count, mean and sum of squared deviations (m2), from which variance and confidence
+    # intervals follow; accumulators of disjoint sample sets can be merged
+
+    def merge(self, other):
+        self.count, self.mean, self.m2 = combine_moments(self.count, self.mean, self.m2,
+                                                         other.count, other.mean, other.m2)
+
+    @property
+    def variance(self):
+        return self.m2 / np.maximum(self.count - 1, 1)
+
+    def confidence_interval(self, z=1.96):
+        # half-width of the normal-approximation confidence interval of the mean
+        return z * np.sqrt(self.variance / np.maximum(self.count, 1))
+
+    def get_state(self):
+        return {"count": np.asarray(self.count), "mean": np.asarray(self.mean), "m2": np.asarray(self.m2)}
+
+    def set_state(self, count, mean, m2):
+        self.count, self.mean, self.m2 = count, np.array(mean, dtype=float), np.array(m2, dtype=float)
+
+
+class WelfordAccumulator(MomentAccumulator):
+    # running mean and variance (Welford) of a scalar or of a fixed-shape array; memory stays
+    # constant in the number of samples
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.full(shape, fill_value=0.)
+        self.m2 = np.full(shape, fill_value=0.)
+
+    def update(self, value):
+        self.update_batch(np.asarray(value, dtype=float)[np.newaxis])
+
+    def update_batch(self, values):
+        self.count, self.mean, self.m2 = combine_moments(self.count, self.mean, self.m2, *batch_moments(values))
+
+    def set_state(self, count, mean, m2):
+        super(WelfordAccumulator, self).set_state(int(count), mean, m2)
+
+
+class CurveAccumulator(MomentAccumulator):
+    # per-step Welford mean and variance across runs, i.e. an averaged learning curve that
+    # is fed one step (for any number of runs) at a time instead of being kept as a (runs, steps) matrix
+
+    def __init__(self, n_steps):
+        self.n_steps = n_steps
+        self.count = np.full(n_steps, fill_value=0, dtype="int64")
+        self.mean = np.full(n_steps, fill_value=0.)
+        self.m2 = np.full(n_steps, fill_value=0.)
+
+    def update(self, step_i, values):
+        self.count[step_i], self.mean[step_i], self.m2[step_i] = combine_moments(
+            self.count[step_i], self.mean[step_i], self.m2[step_i], *batch_moments(np.atleast_1d(values)))
+
+    def set_state(self, count, mean, m2):
+        super(CurveAccumulator, self).set_state(np.array(count, dtype="int64"), mean, m2)
+        self.n_steps = len(self.mean)
+
+
+DEFAULT_N_BUCKETS = 2000
+
+
+class DecimatedCurve(object):
+    # multi-resolution summary of an averaged learning curve: per bucket of bucket_size consecutive steps,
+    # the min / mean / max of the per-step means across runs and the mean confidence interval half-width.
+    # It is fed one step at a time like CurveAccumulator, but holds (and plots, and stores) n_buckets
+    # points instead of n_steps; coarsen() merges neighbouring buckets into a lower resolution
+
+    def __init__(self, n_steps, n_buckets=DEFAULT_N_BUCKETS):
+        self.n_steps = n_steps
+        self.bucket_size = max(1, -(-n_steps // n_buckets))
+        n_buckets = -(-n_steps // self.bucket_size)
+        self.count = np.full(n_buckets, fill_value=0, dtype="int64")
+        self.minimum = np.full(n_buckets, fill_value=np.inf)
+        self.maximum = np.full(n_buckets, fill_value=-np.inf)
+        self.total = np.full(n_buckets, fill_value=0.)
+        self.confidence_interval_sum = np.full(n_buckets, fill_value=0.)
+
+    @classmethod
+    def from_curve(cls, curve, n_buckets=DEFAULT_N_BUCKETS, z=1.96):
+        # decimates a complete CurveAccumulator
+        decimated_curve = cls(curve.n_steps, n_buckets)
+        bucket_starts = np.arange(0, curve.n_steps, decimated_curve.bucket_size)
+        decimated_curve.count = np.diff(np.append(bucket_starts, curve.n_steps))
+        decimated_curve.minimum = np.minimum.reduceat(curve.mean, bucket_starts)
+        decimated_curve.maximum = np.maximum.reduceat(curve.mean, bucket_starts)
+        decimated_curve.total = np.add.reduceat(curve.mean, bucket_starts)
+        decimated_curve.confidence_interval_sum = np.add.reduceat(curve.confidence_interval(z), bucket_starts)
+        return decimated_curve
+
+    def update(self, step_i, values, z=1.96):
+        # values of all runs at step step_i
+        count, mean, m2 = batch_moments(np.atleast_1d(values))
+        confidence_interval = z * np.sqrt(m2 / max(count - 1, 1) / count)
+
+        bucket_i = step_i // self.bucket_size
+        self.count[bucket_i] += 1
+        self.minimum[bucket_i] = min(self.minimum[bucket_i], mean)
+        self.maximum[bucket_i] = max(self.maximum[bucket_i], mean)
+        self.total[bucket_i] += mean
+        self.confidence_interval_sum[bucket_i] += confidence_interval
+
+    def coarsen(self, factor):
+        # the same curve with factor times fewer, wider buckets
+        bucket_starts = np.arange(0, len(self.count), factor)
+        coarse_curve = DecimatedCurve(self.n_steps, len(bucket_starts))
+        coarse_curve.set_state(self.n_steps, self.bucket_size * factor,
+                               np.add.reduceat(self.count, bucket_starts),
+                               np.minimum.reduceat(self.minimum, bucket_starts),
+                               np.maximum.reduceat(self.maximum, bucket_starts),
+                               np.add.reduceat(self.total, bucket_starts),
+                               np.add.reduceat(self.confidence_interval_sum, bucket_starts))
+        return coarse_curve
+
+    @property
+    def steps(self):
+        # center step of every bucket
+        bucket_starts = np.arange(len(self.count)) * self.bucket_size
+        return bucket_starts + (self.count - 1) / 2.
+
+    @property
+    def mean(self):
+        return self.total / np.maximum(self.count, 1)
+
+    def confidence_interval(self):
+        return self.confidence_interval_sum / np.maximum(self.count, 1)
+
+    def get_state(self):
+        return {"n_steps": self.n_steps, "bucket_size": self.bucket_size, "count": self.count,
+                "minimum": self.minimum, "maximum": self.maximum, "total": self.total,
+                "confidence_interval_sum": self.confidence_interval_sum}
+
+    def set_state(self, n_steps, bucket_size, count, minimum, maximum, total, confidence_interval_sum):
+        self.n_steps, self.bucket_size = int(n_steps), int(bucket_size)
+        self.count = np.array(count, dtype="int64")
+        self.minimum, self.maximum = np.array(minimum, dtype=float), np.array(maximum, dtype=float)
+        self.total = np.array(total, dtype=float)
+        self.confidence_interval_sum = np.array(confidence_interval_sum, dtype=float)
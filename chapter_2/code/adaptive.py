@@ -0,0 +1,40 @@
+import numpy as np
+
+# Sequential stopping: instead of a fixed number of runs, runs are added in batches until the
+# confidence intervals of the monitored results are narrower than a target width
+
+
+def get_confidence_interval_width(accumulator, z=1.96):
+    # full width (upper minus lower bound) of the confidence interval of the mean; for a learning
+    # curve or several estimators, the widest one; diverged results (NaN) are left out
+    return 2 * np.nanmax(accumulator.confidence_interval(z))
+
+
+def have_converged(accumulators, target_width, z=1.96):
+    # a variance, and thus a confidence interval, needs at least two runs
+    return all(np.min(accumulator.count) > 1 and get_confidence_interval_width(accumulator, z) <= target_width
+               for accumulator in accumulators)
+
+
+def run_until_converged(simulate_runs, is_converged, batch_runs, max_runs):
+    """
+    Call simulate_runs(first_run_i, n_runs), which returns a list of accumulators for n_runs new runs,
+    for batches of batch_runs runs and merge the batches' accumulators, until is_converged(accumulators)
+    holds or max_runs runs are done.
+
+    Returns the merged accumulators and the number of runs done.
+    """
+    accumulators, n_runs = None, 0
+    while n_runs < max_runs:
+        batch_accumulators = simulate_runs(n_runs, min(batch_runs, max_runs - n_runs))
+        if accumulators is None:
+            accumulators = batch_accumulators
+        else:
+            for accumulator, batch_accumulator in zip(accumulators, batch_accumulators):
+                accumulator.merge(batch_accumulator)
+        n_runs += min(batch_runs, max_runs - n_runs)
+
+        if is_converged(accumulators):
+            break
+
+    return accumulators, n_runs
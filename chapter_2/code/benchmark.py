@@ -0,0 +1,155 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from estimators import SampleAverageEstimator, WeightedEstimator, UCBEstimator, GradientBandit
+from estimators import BatchedSampleAverageEstimator, BatchedWeightedEstimator, BatchedUCBEstimator, \
+    BatchedGradientBandit
+from testbed import K_armed_testbed, Batched_K_armed_testbed
+
+# Throughput benchmark of select + sample + update cycles against the testbed, per estimator, k and
+# batch size (batch size 1 runs the single-run classes, larger ones the batched classes). Results go
+# to a JSON file and can be compared against a stored baseline, e.g.
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --output current.json --baseline baseline.json
+# The committed baseline.json holds the default configurations measured on the machine and numpy
+# recorded in it; speeds are only comparable on similar hardware, so regenerate it for a new machine.
+
+ESTIMATORS = {
+    "SampleAverageEstimator": (SampleAverageEstimator, BatchedSampleAverageEstimator, {"epsilon": 0.1}),
+    "WeightedEstimator": (WeightedEstimator, BatchedWeightedEstimator, {"epsilon": 0.1, "alpha": 0.1}),
+    "UCBEstimator": (UCBEstimator, BatchedUCBEstimator, {"epsilon": 0.1, "alpha": 0.1, "c": 2}),
+    "GradientBandit": (GradientBandit, BatchedGradientBandit, {"alpha": 0.1}),
+}
+
+DEFAULT_K = [10, 100, 1000, 10000]
+DEFAULT_BATCH_SIZES = [1, 100, 1000]
+DEFAULT_N_STEPS = 1000
+# large (k, batch size) configurations get fewer steps, so no configuration handles much more
+# than this many (step x batch row x arm) values; throughput is normalized per step anyway
+STEP_ELEMENTS_BUDGET = 2 * 10 ** 8
+MIN_N_STEPS = 10
+
+
+def get_n_steps(n_steps, k, batch_size):
+    return max(MIN_N_STEPS, min(n_steps, STEP_ELEMENTS_BUDGET // (k * batch_size)))
+
+
+def create_bandit(estimator_name, k, batch_size, random_state):
+    single_class, batched_class, parameters = ESTIMATORS[estimator_name]
+    if batch_size == 1:
+        testbed = K_armed_testbed(k_actions=k, random_state=random_state)
+        estimator = single_class(np.full(k, fill_value=0.0), random_state=random_state, **parameters)
+    else:
+        testbed = Batched_K_armed_testbed(n_runs=batch_size, k_actions=k, random_state=random_state)
+        estimator = batched_class(np.full((batch_size, k), fill_value=0.0), random_state=random_state, **parameters)
+    return testbed, estimator
+
+
+def run_steps(testbed, estimator, n_steps):
+    for step_i in range(n_steps):
+        action_selected = estimator.select_action()
+        reward = testbed.sample_action(action_selected)
+        estimator.update_estimates(action_selected, reward)
+        testbed.random_walk_action_values()
+
+
+def measure(estimator_name, k, batch_size, n_steps, repeats, seed):
+    """Best-of-repeats steps/sec (one step per batch row counts as one step) and peak traced memory"""
+    seconds = []
+    for _ in range(repeats):
+        testbed, estimator = create_bandit(estimator_name, k, batch_size, np.random.RandomState(seed))
+        start = time.perf_counter()
+        run_steps(testbed, estimator, n_steps)
+        seconds.append(time.perf_counter() - start)
+
+    # memory is traced in a separate run, as tracing slows down allocations
+    tracemalloc.start()
+    testbed, estimator = create_bandit(estimator_name, k, batch_size, np.random.RandomState(seed))
+    run_steps(testbed, estimator, n_steps)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "estimator": estimator_name,
+        "k": k,
+        "batch_size": batch_size,
+        "n_steps": n_steps,
+        "steps_per_sec": n_steps * batch_size / min(seconds),
+        "peak_memory_bytes": peak_memory
+    }
+
+
+def get_entry_key(entry):
+    return entry["estimator"], entry["k"], entry["batch_size"]
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs. baseline per configuration; returns the list of regressed configurations"""
+    baseline_entries = {get_entry_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+
+    print("%-24s %6s %6s %14s %8s %8s" % ("estimator", "k", "batch", "steps/sec", "speed", "memory"))
+    for entry in results["results"]:
+        baseline_entry = baseline_entries.get(get_entry_key(entry))
+        if baseline_entry is None:
+            print("%-24s %6d %6d %14.0f %8s %8s" % (get_entry_key(entry) + (entry["steps_per_sec"], "new", "new")))
+            continue
+
+        speed_ratio = entry["steps_per_sec"] / baseline_entry["steps_per_sec"]
+        memory_ratio = entry["peak_memory_bytes"] / max(baseline_entry["peak_memory_bytes"], 1)
+        is_regression = speed_ratio < 1. - tolerance or memory_ratio > 1. + tolerance
+        if is_regression:
+            regressions.append(get_entry_key(entry))
+
+        print("%-24s %6d %6d %14.0f %7.2fx %7.2fx%s" % (get_entry_key(entry) + (
+            entry["steps_per_sec"], speed_ratio, memory_ratio, "  REGRESSION" if is_regression else "")))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="benchmark.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON file of earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown / memory growth over the baseline that counts as a regression")
+    parser.add_argument("--estimators", nargs="+", default=list(ESTIMATORS), choices=list(ESTIMATORS))
+    parser.add_argument("--k", nargs="+", type=int, default=DEFAULT_K)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--steps", type=int, default=DEFAULT_N_STEPS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=250)
+    args = parser.parse_args()
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "results": []
+    }
+
+    for estimator_name in args.estimators:
+        for k in args.k:
+            for batch_size in args.batch_sizes:
+                n_steps = get_n_steps(args.steps, k, batch_size)
+                entry = measure(estimator_name, k, batch_size, n_steps, args.repeats, args.seed)
+                results["results"].append(entry)
+                print("%-24s k=%-6d batch=%-6d %14.0f steps/sec %10.1f MiB" % (
+                    estimator_name, k, batch_size, entry["steps_per_sec"], entry["peak_memory_bytes"] / 2 ** 20))
+
+    with open(args.output, "w") as jsonfile:
+        json.dump(results, jsonfile, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as jsonfile:
+            baseline = json.load(jsonfile)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("%d configuration(s) regressed beyond %.0f%%" % (len(regressions), args.tolerance * 100))
+            sys.exit(1)
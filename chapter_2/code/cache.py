@@ -0,0 +1,38 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class ResultCache(object):
+    # Content-addressed store for experiment results: every result is filed under the hash of a
+    # description of the experiment that produced it (estimators, parameters, k, steps, runs, seed),
+    # as a compressed .npz file of named arrays in the cache directory
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(description):
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_path(self, description):
+        return os.path.join(self.directory, self.get_key(description) + ".npz")
+
+    def load(self, description):
+        # returns the cached arrays as a dict, or None if the experiment hasn't been computed yet
+        path = self.get_path(description)
+        if not os.path.isfile(path):
+            return None
+
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files if name != "description"}
+
+    def save(self, description, **arrays):
+        # written to a temporary file first, so an interrupted save never leaves a truncated result behind
+        path = self.get_path(description)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as npzfile:
+            np.savez_compressed(npzfile, description=json.dumps(description, sort_keys=True), **arrays)
+        os.replace(temporary_path, path)
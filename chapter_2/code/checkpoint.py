@@ -0,0 +1,31 @@
+import os
+import pickle
+
+# Checkpoints are pickles of whatever state a simulation needs to continue, e.g. testbed, estimators,
+# their shared numpy.random.RandomState and partial accumulators. Objects referenced from several
+# places (like the RandomState) stay shared after loading, so a resumed simulation draws exactly the
+# random numbers an uninterrupted one would have drawn. Pre-generated chunks of random numbers (the
+# testbed's trajectory and noise, the estimators' uniforms) aren't pickled but drawn again on loading
+# from the RNG state they were drawn with, so a checkpoint takes kilobytes rather than megabytes.
+
+
+def save_checkpoint(path, state):
+    # written to a temporary file first, so an interruption while saving keeps the previous checkpoint intact
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        pickle.dump(state, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    # returns the saved state, or None if there is no checkpoint to resume from
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "rb") as checkpoint_file:
+        return pickle.load(checkpoint_file)
+
+
+def remove_checkpoint(path):
+    if os.path.isfile(path):
+        os.remove(path)
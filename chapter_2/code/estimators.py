@@ -1,11 +1,55 @@
 import numpy as np
+from greedy_index import TournamentTree
+
+# how many uniform draws (per run) UniformStream pre-generates at a time
+UNIFORM_CHUNK_SIZE = 4096
+
+
+class UniformStream(object):
+    # uniforms on [0, 1) drawn in bulk from random_state and handed out one (or one per run) at a time
+
+    def __init__(self, random_state, size=None, chunk_size=UNIFORM_CHUNK_SIZE):
+        self.random_state = random_state
+        self.shape = (chunk_size,) if size is None else (chunk_size, size)
+        self.uniforms_origin = self.random_state.get_state()
+        self.uniforms = self.random_state.rand(*self.shape)
+        self.uniforms_i = 0
+
+    def next(self):
+        if self.uniforms_i == len(self.uniforms):
+            self.uniforms_origin = self.random_state.get_state()
+            self.uniforms = self.random_state.rand(*self.shape)
+            self.uniforms_i = 0
+        uniform = self.uniforms[self.uniforms_i]
+        self.uniforms_i += 1
+        return uniform
+
+    def __getstate__(self):
+        # like K_armed_testbed, pickled without the drawn uniforms, which __setstate__ draws again
+        state = self.__dict__.copy()
+        del state["uniforms"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        random_state = np.random.RandomState()
+        random_state.set_state(self.uniforms_origin)
+        self.uniforms = random_state.rand(*self.shape)
 
 
 class Estimator(object):
-    def __init__(self, action_value_initial_estimates):
+    def __init__(self, action_value_initial_estimates, random_state=None, greedy_index=False):
+        # random_state is a numpy.random.RandomState; the global numpy.random state is used if none is given
+        self.random_state = np.random if random_state is None else random_state
         self.action_value_estimates = action_value_initial_estimates
         self.k_actions = len(action_value_initial_estimates)
         self.action_selected_count = np.full(self.k_actions, fill_value=0, dtype="int64")
+        # with greedy_index, the greedy action is tracked incrementally (O(log k) per update)
+        # instead of being found with a full O(k) argmax on every selection
+        self.greedy_index = TournamentTree(self.action_value_estimates) if greedy_index else None
+        # set by estimators whose estimates can stop being finite (see GradientBandit); the results of
+        # a diverged run are meaningless
+        self.diverged = False
 
     def select_action(self):
         raise NotImplementedError("Need to implement a method to select actions")
@@ -14,15 +58,21 @@ class Estimator(object):
         raise NotImplementedError("Need to implement a method to update action value estimates")
 
     def select_greedy_action(self):
+        if self.greedy_index is not None:
+            return self.greedy_index.argmax()
         return np.argmax(self.action_value_estimates)
 
     def select_action_randomly(self):
-        return np.random.choice(self.k_actions)
+        return self.random_state.choice(self.k_actions)
+
+    def update_greedy_index(self, action_i):
+        if self.greedy_index is not None:
+            self.greedy_index.update(action_i, self.action_value_estimates[action_i])
 
 
 class SampleAverageEstimator(Estimator):
-    def __init__(self, action_value_initial_estimates, epsilon):
-        super(SampleAverageEstimator, self).__init__(action_value_initial_estimates)
+    def __init__(self, action_value_initial_estimates, epsilon, random_state=None, greedy_index=False):
+        super(SampleAverageEstimator, self).__init__(action_value_initial_estimates, random_state, greedy_index)
         self.epsilon = epsilon
 
     def update_estimates(self, action_selected, r):
@@ -32,9 +82,10 @@ class SampleAverageEstimator(Estimator):
         n = self.action_selected_count[action_selected]
 
         self.action_value_estimates[action_selected] = qn + (1.0 / n) * (r - qn)
+        self.update_greedy_index(action_selected)
 
     def select_action(self):
-        probability = np.random.rand()
+        probability = self.random_state.rand()
         if probability >= self.epsilon:
             return self.select_greedy_action()
 
@@ -42,65 +93,77 @@ class SampleAverageEstimator(Estimator):
 
 
 class WeightedEstimator(SampleAverageEstimator):
-    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5):
-        super(WeightedEstimator, self).__init__(action_value_initial_estimates, epsilon)
+    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5, random_state=None, greedy_index=False):
+        super(WeightedEstimator, self).__init__(action_value_initial_estimates, epsilon, random_state, greedy_index)
         self.alpha = alpha
 
     def update_estimates(self, action_selected, r):
         qn = self.action_value_estimates[action_selected]
 
         self.action_value_estimates[action_selected] = qn + self.alpha * (r - qn)
+        self.update_greedy_index(action_selected)
 
 
 class UCBEstimator(WeightedEstimator):
-    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5, c=2):
-        super(UCBEstimator, self).__init__(action_value_initial_estimates, epsilon, alpha)
+    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5, c=2, random_state=None,
+                 greedy_index=False):
+        super(UCBEstimator, self).__init__(action_value_initial_estimates, epsilon, alpha, random_state, greedy_index)
         self.c = c
         self.t = 0
+        # ln(t) is computed once per step, and the never selected actions are tracked as they get selected
+        self.ln_t = -np.inf
+        self.actions_never_selected = [action_i for action_i in range(self.k_actions)
+                                       if self.action_selected_count[action_i] == 0]
 
     def select_action(self):
         self.t += 1
-        probability = np.random.rand()
+        self.ln_t = np.log(self.t)
+        probability = self.random_state.rand()
         if probability >= self.epsilon:
             return self.select_greedy_action()
 
         return self.select_ucb_action()
 
-    def calculate_action_potential(self, action_i):
-        q_t = self.action_value_estimates[action_i]
-        ln_t = np.log(self.t)
-        n_t = self.action_selected_count[action_i]
-
-        return q_t + self.c * np.sqrt(ln_t / n_t)
+    def calculate_action_potentials(self):
+        return self.action_value_estimates + self.c * np.sqrt(self.ln_t / self.action_selected_count)
 
     def select_ucb_action(self):
         greedy_action = self.select_greedy_action()
 
-        if 0 in self.action_selected_count:
-            actions_never_selected = [action_i for action_i in range(self.k_actions)
-                                      if self.action_selected_count[action_i] == 0]
-            selected_action = np.random.choice(actions_never_selected)
+        if self.actions_never_selected:
+            selected_action = self.random_state.choice(self.actions_never_selected)
+            self.actions_never_selected.remove(selected_action)
             self.action_selected_count[selected_action] += 1
             return selected_action
 
-        action_potential = [self.calculate_action_potential(action_i) for action_i in range(self.k_actions)]
+        action_potential = self.calculate_action_potentials()
         action_potential[greedy_action] = -1
 
         return np.argmax(action_potential)
 
 
 class GradientBandit(Estimator):
-    def __init__(self, action_value_initial_estimates, alpha):
-        super(GradientBandit, self).__init__(action_value_initial_estimates)
+    # With α > 2, the average reward baseline overshoots (each update moves it past the reward) and blows up
+    # along with the preferences, until these aren't finite any more. Such a run is marked as diverged and
+    # selects actions at random from then on, so a sweep over α can finish; its results should be discarded.
+
+    def __init__(self, action_value_initial_estimates, alpha, random_state=None):
+        super(GradientBandit, self).__init__(action_value_initial_estimates, random_state)
         self.average_reward = 0
         self.numerical_preference = np.full(self.k_actions, fill_value=0.)
         self.alpha = alpha
+        # the softmax is cached from select_action to update_estimates (the preferences don't change
+        # in between), and the uniforms for inverse CDF sampling are drawn in bulk
+        self.action_probabilities = None
+        self.uniforms = UniformStream(self.random_state)
 
     def update_average_reward(self, r):
         qn = self.average_reward
         self.average_reward = qn + self.alpha * (r - qn)
 
     def update_estimates(self, action_selected, r):
+        if self.diverged:
+            return
         self.update_average_reward(r)
 
         P = self.get_actions_probabilities()
@@ -111,10 +174,182 @@ class GradientBandit(Estimator):
         htp1[action_selected] = ht[action_selected] + self.alpha * (r - baseline) * (1 - P[action_selected])
 
         self.numerical_preference = htp1
+        self.action_probabilities = None
+
+    def get_actions_probabilities(self):
+        if self.action_probabilities is None:
+            # shifting by the largest preference keeps np.exp from overflowing and doesn't change the softmax
+            exp_numerical_preference = np.exp(self.numerical_preference - np.max(self.numerical_preference))
+            self.action_probabilities = exp_numerical_preference / np.sum(exp_numerical_preference)
+        return self.action_probabilities
+
+    def select_action(self):
+        if self.diverged:
+            return self.select_action_randomly()
+        # inverse CDF sampling
+        cumulative_probabilities = np.cumsum(self.get_actions_probabilities())
+        if not np.isfinite(cumulative_probabilities[-1]):
+            self.diverged = True
+            return self.select_action_randomly()
+        probability = self.uniforms.next() * cumulative_probabilities[-1]
+        # the last arm takes everything past the second-to-last boundary, rounding included
+        return np.searchsorted(cumulative_probabilities[:-1], probability, side="right")
+
+
+class BatchedEstimator(object):
+    # Batched counterpart of Estimator: the state of n_runs independent runs is kept
+    # as (n_runs, k) matrices, and every call takes/returns one action (and reward) per run
+
+    def __init__(self, action_value_initial_estimates, random_state=None):
+        self.random_state = np.random if random_state is None else random_state
+        self.action_value_estimates = action_value_initial_estimates
+        self.n_runs, self.k_actions = action_value_initial_estimates.shape
+        self.runs = np.arange(self.n_runs)
+        self.action_selected_count = np.full((self.n_runs, self.k_actions), fill_value=0, dtype="int64")
+        self.diverged = np.full(self.n_runs, fill_value=False)
+
+    def select_action(self):
+        raise NotImplementedError("Need to implement a method to select actions")
+
+    def update_estimates(self):
+        raise NotImplementedError("Need to implement a method to update action value estimates")
+
+    def get_run_parameter(self, value):
+        # parameters (ε, α, c) are either one value for all runs or one value per run, e.g. to
+        # simulate several parameter settings as one batch; either way they are kept per run
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.n_runs,))
+
+    def select_greedy_action(self):
+        return np.argmax(self.action_value_estimates, axis=1)
+
+    def select_action_randomly(self):
+        return self.random_state.randint(self.k_actions, size=self.n_runs)
+
+
+class BatchedSampleAverageEstimator(BatchedEstimator):
+    def __init__(self, action_value_initial_estimates, epsilon, random_state=None):
+        super(BatchedSampleAverageEstimator, self).__init__(action_value_initial_estimates, random_state)
+        self.epsilon = self.get_run_parameter(epsilon)
+
+    def update_estimates(self, actions_selected, r):
+        self.action_selected_count[self.runs, actions_selected] += 1
+
+        qn = self.action_value_estimates[self.runs, actions_selected]
+        n = self.action_selected_count[self.runs, actions_selected]
+
+        self.action_value_estimates[self.runs, actions_selected] = qn + (1.0 / n) * (r - qn)
+
+    def select_action(self):
+        probability = self.random_state.rand(self.n_runs)
+        return np.where(probability >= self.epsilon, self.select_greedy_action(), self.select_action_randomly())
+
+
+class BatchedWeightedEstimator(BatchedSampleAverageEstimator):
+    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5, random_state=None):
+        super(BatchedWeightedEstimator, self).__init__(action_value_initial_estimates, epsilon, random_state)
+        self.alpha = self.get_run_parameter(alpha)
+
+    def update_estimates(self, actions_selected, r):
+        qn = self.action_value_estimates[self.runs, actions_selected]
+
+        self.action_value_estimates[self.runs, actions_selected] = qn + self.alpha * (r - qn)
+
+
+class BatchedUCBEstimator(BatchedWeightedEstimator):
+    def __init__(self, action_value_initial_estimates, epsilon=0, alpha=0.5, c=2, random_state=None):
+        super(BatchedUCBEstimator, self).__init__(action_value_initial_estimates, epsilon, alpha, random_state)
+        self.c = self.get_run_parameter(c)
+        self.t = 0
+        # ln(t) is computed once per step, and each run's count of never selected actions is tracked
+        # as they get selected, so runs past their initial exploration skip the never-selected scan
+        self.ln_t = -np.inf
+        self.n_actions_never_selected = np.sum(self.action_selected_count == 0, axis=1)
+
+    def select_action(self):
+        self.t += 1
+        self.ln_t = np.log(self.t)
+        probability = self.random_state.rand(self.n_runs)
+        actions_selected = self.select_greedy_action()
+
+        ucb_runs = np.flatnonzero(probability < self.epsilon)
+        if len(ucb_runs) > 0:
+            actions_selected[ucb_runs] = self.select_ucb_action(ucb_runs, actions_selected[ucb_runs])
+
+        return actions_selected
+
+    def calculate_action_potentials(self, runs_i):
+        q_t = self.action_value_estimates[runs_i]
+        n_t = self.action_selected_count[runs_i]
+
+        return q_t + self.c[runs_i, np.newaxis] * np.sqrt(self.ln_t / n_t)
+
+    def select_ucb_action(self, runs_i, greedy_actions):
+        selected_actions = np.empty(len(runs_i), dtype="int64")
+        has_never_selected = self.n_actions_never_selected[runs_i] > 0
+
+        if np.any(has_never_selected):
+            # a uniformly random never-selected action per run: the largest of random keys drawn for those actions
+            exploring_runs = runs_i[has_never_selected]
+            never_selected = self.action_selected_count[exploring_runs] == 0
+            random_keys = np.where(never_selected, self.random_state.rand(len(exploring_runs), self.k_actions), -1.)
+            never_selected_actions = np.argmax(random_keys, axis=1)
+
+            self.action_selected_count[exploring_runs, never_selected_actions] += 1
+            self.n_actions_never_selected[exploring_runs] -= 1
+            selected_actions[has_never_selected] = never_selected_actions
+
+        if not np.all(has_never_selected):
+            potential_runs = ~has_never_selected
+            action_potential = self.calculate_action_potentials(runs_i[potential_runs])
+            action_potential[np.arange(len(action_potential)), greedy_actions[potential_runs]] = -1
+            selected_actions[potential_runs] = np.argmax(action_potential, axis=1)
+
+        return selected_actions
+
+
+class BatchedGradientBandit(BatchedEstimator):
+    # runs diverge like GradientBandit's (α > 2), and are marked as diverged and act at random from then on
+
+    def __init__(self, action_value_initial_estimates, alpha, random_state=None):
+        super(BatchedGradientBandit, self).__init__(action_value_initial_estimates, random_state)
+        self.average_reward = np.full(self.n_runs, fill_value=0.)
+        self.numerical_preference = np.full((self.n_runs, self.k_actions), fill_value=0.)
+        self.alpha = self.get_run_parameter(alpha)
+        self.action_probabilities = None
+        self.uniforms = UniformStream(self.random_state, size=self.n_runs)
+
+    def update_average_reward(self, r):
+        qn = self.average_reward
+        self.average_reward = qn + self.alpha * (r - qn)
+
+    def update_estimates(self, actions_selected, r):
+        self.update_average_reward(r)
+
+        P = self.get_actions_probabilities()
+        baseline = self.average_reward
+
+        ht = self.numerical_preference
+        htp1 = ht - (self.alpha * (r - baseline))[:, np.newaxis] * P
+        htp1[self.runs, actions_selected] = ht[self.runs, actions_selected] + \
+            self.alpha * (r - baseline) * (1 - P[self.runs, actions_selected])
+
+        self.numerical_preference = htp1
+        self.action_probabilities = None
 
     def get_actions_probabilities(self):
-        exp_numerical_preference = np.exp(self.numerical_preference)
-        return exp_numerical_preference / np.sum(exp_numerical_preference)
+        if self.action_probabilities is None:
+            exp_numerical_preference = np.exp(
+                self.numerical_preference - np.max(self.numerical_preference, axis=1, keepdims=True))
+            self.action_probabilities = exp_numerical_preference / np.sum(exp_numerical_preference, axis=1,
+                                                                          keepdims=True)
+        return self.action_probabilities
 
     def select_action(self):
-        return np.random.choice(a=self.k_actions, p=self.get_actions_probabilities())
+        # inverse CDF sampling, one uniform draw per run
+        cumulative_probabilities = np.cumsum(self.get_actions_probabilities(), axis=1)
+        self.diverged |= ~np.isfinite(cumulative_probabilities[:, -1])
+        probability = self.uniforms.next()[:, np.newaxis] * cumulative_probabilities[:, -1:]
+        actions_selected = np.sum(cumulative_probabilities[:, :-1] <= probability, axis=1)
+        if np.any(self.diverged):
+            actions_selected = np.where(self.diverged, self.select_action_randomly(), actions_selected)
+        return actions_selected
@@ -0,0 +1,34 @@
+import numpy as np
+
+
+class TournamentTree(object):
+    # Keeps the index of the largest of k values up to date under single-value updates:
+    # every inner node of a complete binary tree holds the winner (argmax) of its two children,
+    # so an update replays the O(log k) matches on its leaf-to-root path, and argmax is O(1).
+    # Ties go to the lower index, just like np.argmax.
+
+    def __init__(self, values):
+        self.k = len(values)
+        self.size = 1
+        while self.size < self.k:
+            self.size *= 2
+
+        # leaves beyond k are padding that never beats a real value
+        self.values = [float(value) for value in values] + [-np.inf] * (self.size - self.k)
+        self.winners = [0] * self.size + list(range(self.size))
+        for node in range(self.size - 1, 0, -1):
+            self.winners[node] = self.play_match(node)
+
+    def play_match(self, node):
+        left_winner, right_winner = self.winners[2 * node], self.winners[2 * node + 1]
+        return left_winner if self.values[left_winner] >= self.values[right_winner] else right_winner
+
+    def update(self, index, value):
+        self.values[index] = float(value)
+        node = (index + self.size) // 2
+        while node >= 1:
+            self.winners[node] = self.play_match(node)
+            node //= 2
+
+    def argmax(self):
+        return self.winners[1]
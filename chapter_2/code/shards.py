@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import numpy as np
+from accumulators import WelfordAccumulator
+
+# A sweep can be split across machines that share nothing but files: every machine runs one shard,
+# a deterministic subset of the (parameter setting, run) cells (see sweep.get_shard_cells), and writes
+# the shard's partial accumulators to a shard file. Merging the files of all shards gives the aggregates
+# of a single-node run, as every cell's RNG stream only depends on the root seed, the parameter setting
+# and the run index. The cells' results are identical, but the merged mean and variance only match the
+# single-node ones within floating-point tolerance (compare with np.allclose): a single-node run folds
+# the cells one by one in cell order, while merging combines whole shards. Merge shard files with
+#   python shards.py shard_1_of_4.npz shard_2_of_4.npz shard_3_of_4.npz shard_4_of_4.npz --output merged.npz
+# the merged file is a shard file holding all shards, which can be merged (or plotted) like any other.
+
+
+def parse_shard(text):
+    # "i/N" (i counted from 1) to (shard_i, n_shards) with shard_i counted from 0
+    try:
+        shard_number, n_shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError("shard %r: expected i/N with whole numbers i and N" % text)
+    if not 1 <= shard_number <= n_shards:
+        raise ValueError("shard %r: expected i/N with 1 <= i <= N" % text)
+    return shard_number - 1, n_shards
+
+
+def check_shard(shard, n_cells):
+    # every shard gets at least one cell as long as there are no more shards than cells
+    shard_i, n_shards = shard
+    if not 0 <= shard_i < n_shards <= n_cells:
+        raise ValueError("shard %d/%d: expected i/N with 1 <= i <= N <= %d, the number of cells of the sweep" % (
+            shard_i + 1, n_shards, n_cells))
+
+
+def save_shard(path, description, parameter_settings, accumulators, shard_indices, n_shards):
+    """
+    Write the accumulators of the given shards of n_shards (None for parameter settings without cells
+    in them) to path. description describes the whole sweep, i.e. everything besides the shard that the
+    results depend on; only shard files of the same description can be merged.
+    """
+    if all(accumulator is None for accumulator in accumulators):
+        raise ValueError("shards %s of %d hold no cells, there's nothing to save" % (
+            [shard_i + 1 for shard_i in shard_indices], n_shards))
+    template = next(accumulator for accumulator in accumulators if accumulator is not None)
+    states = [(accumulator or WelfordAccumulator(shape=np.shape(template.mean))).get_state()
+              for accumulator in accumulators]
+
+    # written to a temporary file first, so an interrupted save never leaves a truncated shard behind
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as npzfile:
+        np.savez_compressed(npzfile, description=json.dumps(description, sort_keys=True),
+                            parameter_settings=np.asarray(parameter_settings, dtype=float),
+                            shard_indices=np.asarray(shard_indices, dtype="int64"), n_shards=n_shards,
+                            **{name: np.array([state[name] for state in states]) for name in states[0]})
+    os.replace(temporary_path, path)
+
+
+def load_shard(path):
+    with np.load(path) as data:
+        accumulators = []
+        for count, mean, m2 in zip(data["count"], data["mean"], data["m2"]):
+            accumulator = WelfordAccumulator(shape=np.shape(mean))
+            accumulator.set_state(count, mean, m2)
+            accumulators.append(accumulator)
+
+        return {
+            "description": json.loads(str(data["description"])),
+            "parameter_settings": data["parameter_settings"],
+            "accumulators": accumulators,
+            "shard_indices": [int(shard_i) for shard_i in data["shard_indices"]],
+            "n_shards": int(data["n_shards"])
+        }
+
+
+def merge_shards(paths):
+    """
+    Merge the shard files of a sweep, in shard order, into one accumulator per parameter setting.
+    Raises a ValueError unless the files are of the same sweep and cover each of its shards exactly once.
+    The merged means and variances equal those of a single-node run up to floating-point rounding.
+
+    Returns the sweep's description, parameter settings, accumulators and number of shards.
+    """
+    shards = sorted((load_shard(path) for path in paths), key=lambda shard: shard["shard_indices"])
+    merged_shard = shards[0]
+
+    for shard in shards[1:]:
+        if shard["description"] != merged_shard["description"] or shard["n_shards"] != merged_shard["n_shards"] \
+                or not np.array_equal(shard["parameter_settings"], merged_shard["parameter_settings"]):
+            raise ValueError("shard files of different sweeps can't be merged")
+        for accumulator, shard_accumulator in zip(merged_shard["accumulators"], shard["accumulators"]):
+            accumulator.merge(shard_accumulator)
+        merged_shard["shard_indices"] += shard["shard_indices"]
+
+    if sorted(merged_shard["shard_indices"]) != list(range(merged_shard["n_shards"])):
+        raise ValueError("expected each of the %d shards exactly once, got shards %s" % (
+            merged_shard["n_shards"], [shard_i + 1 for shard_i in sorted(merged_shard["shard_indices"])]))
+
+    return (merged_shard["description"], merged_shard["parameter_settings"], merged_shard["accumulators"],
+            merged_shard["n_shards"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("shard_files", nargs="+")
+    parser.add_argument("--output", default="merged.npz", help="file to write the merged accumulators to")
+    args = parser.parse_args()
+
+    description, parameter_settings, accumulators, n_shards = merge_shards(args.shard_files)
+    save_shard(args.output, description, parameter_settings, accumulators, range(n_shards), n_shards)
+
+    for parameter_setting, accumulator in zip(parameter_settings, accumulators):
+        print("parameter setting %g: %d runs, mean %s" % (parameter_setting, accumulator.count, accumulator.mean))
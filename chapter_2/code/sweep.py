@@ -0,0 +1,192 @@
+import itertools
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from accumulators import WelfordAccumulator
+from adaptive import have_converged
+from cache import ResultCache
+from checkpoint import remove_checkpoint
+
+
+def get_cell_random_state(root_seed, parameter_setting, run_i):
+    # every (parameter setting, run) cell gets its own RNG stream derived from the root seed, the
+    # parameter value (by its bits) and the run index, so a cell's results don't depend on which
+    # worker computes it, in what order, or which other settings the sweep contains
+    parameter_key = int(np.float64(parameter_setting).view(np.uint64))
+    seed_sequence = np.random.SeedSequence(root_seed, spawn_key=(parameter_key, run_i))
+    return np.random.RandomState(np.random.MT19937(seed_sequence))
+
+
+def get_cell_description(cell_description, parameter_setting, root_seed, run_i):
+    return dict(cell_description, parameter_setting=float(parameter_setting), root_seed=root_seed, run_i=run_i)
+
+
+def get_checkpoint_path(checkpoint_dir, description):
+    return os.path.join(checkpoint_dir, ResultCache.get_key(description) + ".pkl")
+
+
+def run_cell(simulate_cell, parameter_setting, root_seed, run_i, checkpoint_path=None):
+    random_state = get_cell_random_state(root_seed, parameter_setting, run_i)
+    if checkpoint_path is None:
+        return simulate_cell(parameter_setting, random_state)
+    return simulate_cell(parameter_setting, random_state, checkpoint_path=checkpoint_path)
+
+
+def get_shard_cells(cells, shard_i, n_shards):
+    # every n_shards-th cell, starting at shard_i, so all shards get about the same number of cells
+    # of every parameter setting
+    return cells[shard_i::n_shards]
+
+
+def run_sweep(simulate_cell, parameter_settings, n_runs, root_seed, n_workers=None, cache=None,
+              cell_description=None, first_run_i=0, checkpoint_dir=None, shard=None):
+    """
+    Run simulate_cell(parameter_setting, random_state) for every (parameter setting, run) cell
+    on a pool of n_workers processes (all cores if None). simulate_cell must be picklable, i.e. a
+    module-level function (bind extra arguments with functools.partial), and return one result
+    per estimator.
+
+    With a ResultCache, cells already computed are loaded instead of simulated, and new cells are
+    saved to it. cell_description (a JSON-serializable dict) describes everything besides parameter
+    setting, seed and run index that the results depend on, e.g. estimators, k and step counts.
+
+    Runs are numbered from first_run_i on, so a sweep can be continued with more runs.
+
+    With a checkpoint_dir, simulate_cell also gets a checkpoint_path keyword argument: the file to
+    periodically save its state to and to resume from. A cell's checkpoint is removed once its result
+    is in. Combined with the cache, an interrupted sweep resumes with the cells it had completed and
+    continues its unfinished cells from their last checkpoints.
+
+    If a cell raises, the cells not started yet are cancelled, those that completed are still saved
+    to the cache, and the error is re-raised.
+
+    With shard=(shard_i, n_shards), only the shard's cells (see get_shard_cells) are simulated; merging
+    the accumulators of all shards gives those of the whole sweep (up to floating-point rounding).
+
+    Returns one WelfordAccumulator of shape (n_estimators,) per parameter setting, holding mean and
+    variance of the results across runs (None for settings without cells in the shard).
+    """
+    cells = list(itertools.product(range(len(parameter_settings)), range(first_run_i, first_run_i + n_runs)))
+    if shard is not None:
+        cells = get_shard_cells(cells, *shard)
+    accumulators = [None] * len(parameter_settings)
+
+    # results are folded into the accumulators in cell order (not in order of completion)
+    # so the aggregates stay bit-identical no matter how many workers run
+    pending_results, next_cell_i = {}, 0
+
+    def fold_pending_results(next_cell_i):
+        while next_cell_i in pending_results:
+            result = pending_results.pop(next_cell_i)
+            parameter_setting_i, _ = cells[next_cell_i]
+            if accumulators[parameter_setting_i] is None:
+                accumulators[parameter_setting_i] = WelfordAccumulator(shape=np.shape(result))
+            accumulators[parameter_setting_i].update(result)
+            next_cell_i += 1
+        return next_cell_i
+
+    descriptions = [get_cell_description(cell_description or {}, parameter_settings[parameter_setting_i],
+                                         root_seed, run_i)
+                    for parameter_setting_i, run_i in cells]
+    if cache is not None:
+        for cell_i in range(len(cells)):
+            cached_result = cache.load(descriptions[cell_i])
+            if cached_result is not None:
+                pending_results[cell_i] = cached_result["result"]
+    next_cell_i = fold_pending_results(next_cell_i)
+
+    checkpoint_paths = [None] * len(cells)
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint_paths = [get_checkpoint_path(checkpoint_dir, description) for description in descriptions]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(run_cell, simulate_cell, parameter_settings[parameter_setting_i], root_seed,
+                                   run_i, checkpoint_paths[cell_i]): cell_i
+                   for cell_i, (parameter_setting_i, run_i) in enumerate(cells)
+                   if cell_i >= next_cell_i and cell_i not in pending_results}
+
+        def save_result(cell_i, result):
+            if cache is not None:
+                cache.save(descriptions[cell_i], result=result)
+            if checkpoint_paths[cell_i] is not None:
+                remove_checkpoint(checkpoint_paths[cell_i])
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            cell_i = futures[future]
+            try:
+                pending_results[cell_i] = future.result()
+            except BaseException:
+                # one failing cell ends the sweep: cells not started yet are cancelled, and the cells
+                # that completed meanwhile are still saved, so a rerun only has to redo the rest
+                executor.shutdown(wait=True, cancel_futures=True)
+                for other_future, other_cell_i in futures.items():
+                    if other_future.done() and not other_future.cancelled() and other_future.exception() is None \
+                            and other_cell_i not in pending_results:
+                        save_result(other_cell_i, other_future.result())
+                raise
+            save_result(cell_i, pending_results[cell_i])
+
+            next_cell_i = fold_pending_results(next_cell_i)
+
+    return accumulators
+
+
+def run_adaptive_sweep(simulate_cell, parameter_settings, target_width, batch_runs, max_runs, root_seed,
+                       n_workers=None, cache=None, cell_description=None, checkpoint_dir=None):
+    """
+    Like run_sweep, but instead of a fixed number of runs, every parameter setting gets batches of
+    batch_runs more runs until the confidence intervals of all its estimators' results are narrower than
+    target_width (or it has max_runs runs). Settings that converge early stop getting runs.
+
+    Returns the per-setting accumulators and the number of runs each setting got.
+    """
+    accumulators = [None] * len(parameter_settings)
+    n_runs = [0] * len(parameter_settings)
+
+    # settings still running all have the same number of runs, so a batch continues at the same run index
+    active_settings_i, first_run_i = list(range(len(parameter_settings))), 0
+    while active_settings_i and first_run_i < max_runs:
+        n_batch_runs = min(batch_runs, max_runs - first_run_i)
+        batch_accumulators = run_sweep(simulate_cell, [parameter_settings[i] for i in active_settings_i],
+                                       n_batch_runs, root_seed, n_workers=n_workers, cache=cache,
+                                       cell_description=cell_description, first_run_i=first_run_i,
+                                       checkpoint_dir=checkpoint_dir)
+
+        for parameter_setting_i, batch_accumulator in zip(active_settings_i, batch_accumulators):
+            if accumulators[parameter_setting_i] is None:
+                accumulators[parameter_setting_i] = batch_accumulator
+            else:
+                accumulators[parameter_setting_i].merge(batch_accumulator)
+            n_runs[parameter_setting_i] += n_batch_runs
+
+        first_run_i += n_batch_runs
+        active_settings_i = [i for i in active_settings_i if not have_converged([accumulators[i]], target_width)]
+
+    return accumulators, n_runs
+
+
+def run_batched_sweep(simulate_batch, parameter_settings, n_runs, root_seed):
+    """
+    Simulate all (parameter setting, run) cells as one batch: simulate_batch(run_parameters, random_state)
+    gets one parameter value per batch row (n_runs rows per setting, settings in order) and returns
+    one result per estimator and row, shape (n_estimators, n_parameter_settings * n_runs).
+    All rows share one RNG stream seeded by root_seed, so unlike run_sweep the results depend on the
+    batch layout.
+
+    Returns one WelfordAccumulator of shape (n_estimators,) per parameter setting, like run_sweep.
+    """
+    run_parameters = np.repeat(np.asarray(parameter_settings, dtype=float), n_runs)
+    random_state = np.random.RandomState(np.random.MT19937(np.random.SeedSequence(root_seed)))
+
+    results = np.asarray(simulate_batch(run_parameters, random_state))
+    results = results.reshape(len(results), len(parameter_settings), n_runs)
+
+    accumulators = []
+    for parameter_setting_i in range(len(parameter_settings)):
+        accumulator = WelfordAccumulator(shape=len(results))
+        accumulator.update_batch(results[:, parameter_setting_i].T)
+        accumulators.append(accumulator)
+
+    return accumulators
@@ -1,25 +1,98 @@
 import numpy as np
-from numpy.random import normal as GaussianDistribution
+
+# when no chunk size is given, chunks hold about this many pre-generated Q*-values (8 MB of float64),
+# but at least MIN_CHUNK_STEPS steps as long as that stays within MAX_CHUNK_ELEMENTS values (64 MB),
+# so large batches don't redraw every few dozen steps; a chunk of 2000 runs x 10 arms thus holds
+# 128 steps, 2.56M values or about 20 MB per pre-generated array
+DEFAULT_CHUNK_ELEMENTS = 2 ** 20
+MIN_CHUNK_STEPS = 128
+MAX_CHUNK_ELEMENTS = 2 ** 23
+
+
+def get_default_chunk_size(n_values):
+    return max(1, min(MIN_CHUNK_STEPS, MAX_CHUNK_ELEMENTS // n_values), DEFAULT_CHUNK_ELEMENTS // n_values)
 
 
 class K_armed_testbed():
     # Q*-values for each one of the k possible actions start out equal
-    # and then take independent random walks
+    # and then take independent random walks.
+    # Random-walk increments and reward noise are drawn in chunks of chunk_size steps/pulls:
+    # the Q*-value trajectory and its optimal actions are computed once per chunk,
+    # and each step/pull then only moves an index into them.
+    # With common_random_numbers, reward noise is drawn per (step, action) instead of per pull,
+    # so all estimators sharing the testbed get the same reward for the same action in the same step,
+    # which reduces the variance of comparisons between them
 
-    def __init__(self, k_actions):
+    def __init__(self, k_actions, random_state=None, chunk_size=None, common_random_numbers=False):
+        # random_state is a numpy.random.RandomState; the global numpy.random state is used if none is given
+        self.random_state = np.random if random_state is None else random_state
         self.k = k_actions
-        # self.action_values = GaussianDistribution(loc=0, scale=1, size=self.k)
-        self.action_values = np.full(self.k, fill_value=0.0)
+        self.common_random_numbers = common_random_numbers
+        self.chunk_size = get_default_chunk_size(self.k) if chunk_size is None else chunk_size
+        # self.generate_action_values_chunk(self.random_state.normal(loc=0, scale=1, size=self.k))
+        self.generate_action_values_chunk(np.full(self.k, fill_value=0.0))
+        # per-pull noise is only used without common random numbers
+        if not self.common_random_numbers:
+            self.generate_reward_noise_chunk()
+
+    @property
+    def action_values(self):
+        return self.action_values_trajectory[self.step_i]
+
+    def generate_action_values_chunk(self, action_values):
+        # what the chunk is drawn from, so a checkpoint can leave the chunk out and redraw it (see __getstate__)
+        self.action_values_chunk_origin = (self.random_state.get_state(), action_values)
+        increments = self.random_state.normal(loc=0, scale=0.01, size=(self.chunk_size, self.k))
+        self.action_values_trajectory = np.vstack((action_values, action_values + np.cumsum(increments, axis=0)))
+        self.optimal_actions = np.argmax(self.action_values_trajectory, axis=1)
+        if self.common_random_numbers:
+            self.action_reward_noise = self.random_state.normal(loc=0, scale=1, size=(self.chunk_size, self.k))
+        self.step_i = 0
+
+    def generate_reward_noise_chunk(self):
+        self.reward_noise_chunk_origin = self.random_state.get_state()
+        self.reward_noise = self.random_state.normal(loc=0, scale=1, size=self.chunk_size)
+        self.reward_noise_i = 0
+
+    def __getstate__(self):
+        # pickled (e.g. for checkpoints) without the pre-generated chunks, which can take megabytes; only
+        # the RNG states and values they were drawn from are kept, and __setstate__ draws them again
+        state = self.__dict__.copy()
+        for name in ["action_values_trajectory", "optimal_actions", "action_reward_noise", "reward_noise"]:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        random_state, step_i = self.random_state, self.step_i
+        rng_state, action_values = self.action_values_chunk_origin
+        self.random_state = np.random.RandomState()
+        self.random_state.set_state(rng_state)
+        self.generate_action_values_chunk(action_values)
+        if not self.common_random_numbers:
+            reward_noise_i = self.reward_noise_i
+            self.random_state.set_state(self.reward_noise_chunk_origin)
+            self.generate_reward_noise_chunk()
+            self.reward_noise_i = reward_noise_i
+        self.random_state, self.step_i = random_state, step_i
 
     def random_walk_action_values(self):
-        increment = GaussianDistribution(loc=0, scale=0.01, size=self.k)
-        self.action_values += increment
+        self.step_i += 1
+        if self.step_i == self.chunk_size:
+            self.generate_action_values_chunk(self.action_values_trajectory[-1])
 
     def sample_action(self, action_i):
-        return GaussianDistribution(loc=self.action_values[action_i], scale=1, size=1)[0]
+        if self.common_random_numbers:
+            return self.action_values[action_i] + self.action_reward_noise[self.step_i, action_i]
+
+        if self.reward_noise_i == self.chunk_size:
+            self.generate_reward_noise_chunk()
+        noise = self.reward_noise[self.reward_noise_i]
+        self.reward_noise_i += 1
+        return self.action_values[action_i] + noise
 
     def get_optimal_action(self):
-        return np.argmax(self.action_values)
+        return self.optimal_actions[self.step_i]
 
     def get_optimal_action_value(self):
         return self.action_values[self.get_optimal_action()]
@@ -29,3 +102,69 @@ class K_armed_testbed():
 
     def __str__(self):
         return "\t".join(["A%d: %.2f" % (action_i, self.action_values[action_i]) for action_i in range(self.k)])
+
+
+class Batched_K_armed_testbed():
+    # Same testbed as K_armed_testbed, but for n_runs independent runs at once:
+    # Q*-values are held as a (n_runs, k) matrix and every step of every run
+    # is advanced with a single array operation
+
+    def __init__(self, n_runs, k_actions, random_state=None, chunk_size=None, common_random_numbers=False):
+        self.random_state = np.random if random_state is None else random_state
+        self.n_runs = n_runs
+        self.k = k_actions
+        self.common_random_numbers = common_random_numbers
+        self.runs = np.arange(self.n_runs)
+        self.chunk_size = get_default_chunk_size(self.n_runs * self.k) if chunk_size is None else chunk_size
+        self.generate_action_values_chunk(np.full((self.n_runs, self.k), fill_value=0.0))
+        if not self.common_random_numbers:
+            self.generate_reward_noise_chunk()
+
+    @property
+    def action_values(self):
+        return self.action_values_trajectory[self.step_i]
+
+    def generate_action_values_chunk(self, action_values):
+        increments = self.random_state.normal(loc=0, scale=0.01, size=(self.chunk_size, self.n_runs, self.k))
+        self.action_values_trajectory = np.concatenate(
+            (action_values[np.newaxis], action_values + np.cumsum(increments, axis=0)))
+        self.optimal_actions = np.argmax(self.action_values_trajectory, axis=2)
+        if self.common_random_numbers:
+            self.action_reward_noise = self.random_state.normal(loc=0, scale=1,
+                                                                size=(self.chunk_size, self.n_runs, self.k))
+        self.step_i = 0
+
+    def generate_reward_noise_chunk(self):
+        self.reward_noise = self.random_state.normal(loc=0, scale=1, size=(self.chunk_size, self.n_runs))
+        self.reward_noise_i = 0
+
+    def random_walk_action_values(self):
+        self.step_i += 1
+        if self.step_i == self.chunk_size:
+            self.generate_action_values_chunk(self.action_values_trajectory[-1])
+
+    def sample_action(self, actions_i):
+        # one selected action per run in, one reward per run out
+        if self.common_random_numbers:
+            noise = self.action_reward_noise[self.step_i, self.runs, actions_i]
+            return self.action_values[self.runs, actions_i] + noise
+
+        if self.reward_noise_i == self.chunk_size:
+            self.generate_reward_noise_chunk()
+        noise = self.reward_noise[self.reward_noise_i]
+        self.reward_noise_i += 1
+        return self.action_values[self.runs, actions_i] + noise
+
+    def get_optimal_action(self):
+        return self.optimal_actions[self.step_i]
+
+    def get_optimal_action_value(self):
+        return self.action_values[self.runs, self.get_optimal_action()]
+
+    def is_optimal_action(self, actions_i):
+        return (self.get_optimal_action_value() == self.action_values[self.runs, actions_i]).astype(float)
+
+    def __str__(self):
+        return "\n".join(["R%d\t" % run_i + "\t".join(["A%d: %.2f" % (action_i, self.action_values[run_i, action_i])
+                                                       for action_i in range(self.k)])
+                          for run_i in range(self.n_runs)])
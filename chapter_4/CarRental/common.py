@@ -1,5 +1,7 @@
 from datetime import datetime
 import enum
+import hashlib
+import json
 import numpy as np
 import os
 import pandas as pd
@@ -7,7 +9,11 @@ import scipy.special
 
 from .constants import FILE_SASP_PREFIX, FILE_SPRENRET_PREFIX, FILE_PI_PREFIX, FILE_V_PREFIX
 from .constants import FOLDER_ORIG_PROB_NAME, FOLDER_FULL_PROB_NAME
+from .constants import FOLDER_CACHE_POSTFIX, FILE_CACHE_HEADER, FILE_CSV_HEADER_POSTFIX
 from .constants import PATH_SPRENRET_CSV
+from .constants import MIN_NUMBER_OF_CARS_LOC_1, MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2
+from .constants import DFCOL_SASP_SORIG, DFCOL_SASP_SPSEUDO, DFCOL_SPRENRET_SPSEUDO, DFCOL_SPRENRET_SNEXT
+from .constants import DFCOL_PI_STATE, DFCOL_V_STATE
 
 
 class FileType(enum.Enum):
@@ -40,14 +46,51 @@ def get_state_name(state_a, state_b):
     """Obtain the unique state name in the format <num cars loc A>_<num cars loc B>"""
     return state_a.zfill(2) + "_" + state_b.zfill(2)# helper function to calculate the probability of rentals & returns at a location
 
-def get_state_components(state_name):
-    """Obtain the individual components (# cars at location A and B) for a state name"""
+def get_state_index(state_a, state_b):
+    """Obtain the unique state index a*(<max num cars loc B> + 1) + b; works on numbers and arrays alike"""
+    return (state_a - MIN_NUMBER_OF_CARS_LOC_1) * (MAX_NUMBER_OF_CARS_LOC_2 - MIN_NUMBER_OF_CARS_LOC_2 + 1) + state_b - MIN_NUMBER_OF_CARS_LOC_2
+
+def get_state_components(state_index):
+    """Obtain the individual components (# cars at location A and B) for a state index; works on numbers and arrays alike"""
+    num_cars_b = MAX_NUMBER_OF_CARS_LOC_2 - MIN_NUMBER_OF_CARS_LOC_2 + 1
+    return MIN_NUMBER_OF_CARS_LOC_1 + state_index // num_cars_b, MIN_NUMBER_OF_CARS_LOC_2 + state_index % num_cars_b
+
+def get_state_index_of_name(state_name):
+    """Obtain the state index for a state name, as found in CSV files of earlier versions"""
     comps = list(map(int, (state_name.split('_'))))
-    return comps[0], comps[1]
-    #return list(map(int, (state_name.split('_'))))
+    return get_state_index(comps[0], comps[1])
+
+def _get_state_columns(file_type: FileType):
+    if file_type == FileType.SASP: return [DFCOL_SASP_SORIG, DFCOL_SASP_SPSEUDO]
+    elif file_type == FileType.Sp_Ren_Ret: return [DFCOL_SPRENRET_SPSEUDO, DFCOL_SPRENRET_SNEXT]
+    elif file_type == FileType.Pi: return [DFCOL_PI_STATE]
+    elif file_type == FileType.V: return [DFCOL_V_STATE]
+
+def get_fingerprints(generating_constants):
+    """Fingerprint (SHA-1 of the JSON) of the constants of every stage of a dataframe's generation"""
+    return {stage: hashlib.sha1(json.dumps(stage_constants, sort_keys=True).encode('utf-8')).hexdigest()
+            for stage, stage_constants in generating_constants.items()}
+
+def _get_header(df, generating_constants):
+    return {
+        "columns": list(df.columns),
+        "dtypes": {column: df[column].values.dtype.str for column in df.columns},
+        "num_rows": len(df),
+        "constants": generating_constants,
+        "fingerprints": get_fingerprints(generating_constants)
+    }
+
+def _commit_header(header, abs_file_name):
+    with open(abs_file_name, "w") as header_file:
+        json.dump(header, header_file, indent=2)
 
-def commit_to_csv(df, file_type: FileType, is_orig_problem, seq_nr = 0, dir_path=None):
-    """Commit a dataframe to CSV file"""
+def _load_header(abs_file_name):
+    if os.path.exists(abs_file_name) == False: return None
+    with open(abs_file_name) as header_file:
+        return json.load(header_file)
+
+def commit_to_csv(df, file_type: FileType, is_orig_problem, seq_nr = 0, dir_path=None, generating_constants=None):
+    """Commit a dataframe to CSV file, with a header file stamped with the constants it was generated from if given"""
     suffix_file = file_type in [FileType.SASP, FileType.Sp_Ren_Ret]
     file_name = get_filename(file_type) if suffix_file else get_filename_with_postfix(file_type, seq_nr)
     
@@ -61,6 +104,9 @@ def commit_to_csv(df, file_type: FileType, is_orig_problem, seq_nr = 0, dir_path
 
     abs_file_name = os.path.join(dir_path, file_name)
     df.to_csv(path_or_buf=abs_file_name, sep='\t', encoding='utf-8', index=False)
+    if generating_constants is not None:
+        _commit_header(_get_header(df, generating_constants), 
+                       os.path.join(dir_path, _get_filename_noext(file_type) + FILE_CSV_HEADER_POSTFIX))
     
 def load_from_csv(file_type: FileType, is_orig_problem, seq_nr = 0, dir_path=None):
     """Load a dataframe from CSV file"""
@@ -82,7 +128,70 @@ def load_from_csv(file_type: FileType, is_orig_problem, seq_nr = 0, dir_path=Non
     elif os.path.isdir(abs_file_name) == True:
         raise FileNotFoundError("A directory with the file name you specified already exists. Please resolve the issue and run the code again.")
     
-    return pd.read_csv(filepath_or_buffer=abs_file_name, sep='\t', encoding='utf-8')
+    df = pd.read_csv(filepath_or_buffer=abs_file_name, sep='\t', encoding='utf-8')
+    # states are integer indices; files written by earlier versions hold state names instead
+    for column in _get_state_columns(file_type):
+        if column in df.columns and not pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].map(get_state_index_of_name)
+    return df
+
+def load_csv_header(file_type: FileType, is_orig_problem, dir_path=None):
+    """Load the header file of a CSV file, or None if it has none (e.g. written by earlier versions)"""
+    if dir_path == None: dir_path = PATH_SPRENRET_CSV
+    dir_path = os.path.join(dir_path, FOLDER_ORIG_PROB_NAME) if is_orig_problem == True else os.path.join(dir_path, FOLDER_FULL_PROB_NAME)
+    return _load_header(os.path.join(dir_path, _get_filename_noext(file_type) + FILE_CSV_HEADER_POSTFIX))
+
+def get_cache_dir_path(file_type: FileType, is_orig_problem, dir_path=None):
+    """Obtain the directory of the binary cache of a dataframe, next to its CSV file"""
+    if dir_path == None: dir_path = PATH_SPRENRET_CSV
+    dir_path = os.path.join(dir_path, FOLDER_ORIG_PROB_NAME) if is_orig_problem == True else os.path.join(dir_path, FOLDER_FULL_PROB_NAME)
+    return os.path.join(dir_path, _get_filename_noext(file_type) + FOLDER_CACHE_POSTFIX)
+
+def commit_to_cache(df, file_type: FileType, is_orig_problem, generating_constants, dir_path=None, columns=None):
+    """
+    Commit a dataframe to a binary cache: one .npy file per column and a header (JSON) with the
+    columns, their dtypes, the row count and the constants (and their fingerprints) the data was 
+    generated from. With columns, only the files of these columns are (re)written, the others being 
+    up to date already.
+    """
+    cache_dir_path = get_cache_dir_path(file_type, is_orig_problem, dir_path)
+    if not os.path.exists(cache_dir_path):
+        print("Folder " + cache_dir_path + " could not be found on disk, will create it.")
+        os.makedirs(cache_dir_path)
+    elif os.path.isfile(cache_dir_path) == True:
+        raise FileExistsError("A file with the directory name you specified already exists. Please resolve the issue and run the code again.")
+    
+    # the header goes last, so an interrupted commit leaves no cache that looks complete
+    header_file_name = os.path.join(cache_dir_path, FILE_CACHE_HEADER)
+    if os.path.exists(header_file_name): os.remove(header_file_name)
+    for column in (df.columns if columns is None else columns):
+        # write to a temporary file first, as the current file may still be memory-mapped
+        abs_file_name = os.path.join(cache_dir_path, column + ".npy")
+        with open(abs_file_name + ".tmp", "wb") as column_file:
+            np.save(column_file, df[column].values)
+        os.replace(abs_file_name + ".tmp", abs_file_name)
+    _commit_header(_get_header(df, generating_constants), header_file_name)
+
+def load_from_cache(file_type: FileType, is_orig_problem, dir_path=None):
+    """
+    Load a dataframe from its binary cache, with the columns memory-mapped (read-only) rather than read.
+    Returns the dataframe and the header, or an empty dataframe and None if there's no valid cache.
+    """
+    cache_dir_path = get_cache_dir_path(file_type, is_orig_problem, dir_path)
+    header = _load_header(os.path.join(cache_dir_path, FILE_CACHE_HEADER))
+    if header is None:
+        print("Cache " + cache_dir_path + " could not be found on disk.")
+        return pd.DataFrame(), None
+    
+    columns = {}
+    for column in header["columns"]:
+        abs_file_name = os.path.join(cache_dir_path, column + ".npy")
+        values = np.load(abs_file_name, mmap_mode='r') if os.path.exists(abs_file_name) else None
+        if values is None or values.dtype.str != header["dtypes"][column] or len(values) != header["num_rows"]:
+            print("Cache " + cache_dir_path + " is incomplete or doesn't match its header, will compute and create it instead.")
+            return pd.DataFrame(), None
+        columns[column] = values
+    return pd.DataFrame(columns, copy=False), header
 
 def action_sort(action_name: int):
     """Serve as custom sorter for action names to be sorted by abs(# transfered cars).
@@ -1,16 +1,15 @@
 from datetime import datetime
+import time
 import numpy as np
 import pandas as pd
 
 from .common import FileType, commit_to_csv, load_from_csv
-from .common import action_sort, get_state_name, get_state_components, print_status
+from .common import action_sort, get_state_index, print_status
 from .constants import PATH_SPRENRET_CSV
 from .constants import GAMMA, EPSILON, THETA
 from .constants import DEFAULT_ACTION, DEFAULT_VALUE
-from .constants import DFCOL_SASP_SORIG, DFCOL_SASP_ACTION, DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES
+from .constants import DFCOL_SASP_SORIG, DFCOL_SASP_ACTION, DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES, DFCOL_SASP_Q
 from .constants import DFCOL_SPRENRET_SPSEUDO
-from .constants import DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B
-from .constants import DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B
 from .constants import DFCOL_SPRENRET_SNEXT, DFCOL_SPRENRET_PROBSRSA 
 from .constants import DFCOL_SPRENRET_REWARD, DFCOL_SPRENRET_FEES
 from .constants import DFCOL_PI_STATE, DFCOL_PI_ACTION, DFCOL_PI_PROB
@@ -18,6 +17,8 @@ from .constants import DFCOL_V_STATE, DFCOL_V_VALUE
 from .constants import MIN_NUMBER_OF_CARS_LOC_1, MIN_NUMBER_OF_CARS_LOC_2
 from .constants import MAX_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_2
 from .constants import IS_ORIGINAL_PROBLEM
+from .constants import SOLVER_POLICY_ITERATION, SOLVER_MODIFIED_POLICY_ITERATION, SOLVER_VALUE_ITERATION
+from .model import TransitionModel, FactorizedTransitionModel
 
 def init_policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=-1, v_seq_nr=-1, disk_allowed=False, dir_path=None):    
     # if we need to load one or both of the two dataframes (dfPi, dfV)
@@ -63,12 +64,8 @@ def init_policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=-1, v
         all_sub_states_b = list(range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2 + 1))
         all_states = np.array(np.meshgrid(all_sub_states_a, all_sub_states_b)).T.reshape(-1,2)
 
-        state_names = np.array(["xx_xx"] * num_states)
-        for i in range(num_states):
-            state_name = get_state_name(str(all_states[i,0].item()), str(all_states[i,1].item()))
-            state_names[i] = state_name
-
-        all_states = np.hstack((all_states, np.atleast_2d(state_names).T))
+        state_indices = get_state_index(all_states[:,0], all_states[:,1])
+        all_states = np.hstack((all_states, np.atleast_2d(state_indices).T))
         
         # Create dataframe dfV - init with default value = 0
         mindex = pd.MultiIndex.from_product([all_states[:,-1]], names=[DFCOL_V_STATE])
@@ -85,64 +82,41 @@ def init_policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=-1, v
     
     return dfSASP, dfSp_Ren_Ret, dfV, dfPi, max(pi_seq_nr, v_seq_nr) + 1
     
+def get_afterstate_values(dfSp_Ren_Ret, dfV):
+    """
+    Compute the afterstate value W(s_pseudo) = sum of p(s',r|s_pseudo) * (reward - parking fees + GAMMA*v(s'))
+    once per pseudo-state. Many (state, action) pairs lead to the same pseudo-state, and their action values 
+    only differ by the transfer fees.
+    """
+    dfJoined = pd.merge(dfSp_Ren_Ret[[DFCOL_SPRENRET_SPSEUDO, DFCOL_SPRENRET_SNEXT, DFCOL_SPRENRET_PROBSRSA, 
+                                      DFCOL_SPRENRET_REWARD, DFCOL_SPRENRET_FEES]], 
+                        dfV, how="left", left_on=DFCOL_SPRENRET_SNEXT, right_on=DFCOL_V_STATE)
+    partial_values = dfJoined[DFCOL_SPRENRET_PROBSRSA] * (
+        dfJoined[DFCOL_SPRENRET_REWARD] - dfJoined[DFCOL_SPRENRET_FEES] + GAMMA*dfJoined[DFCOL_V_VALUE])
+    return partial_values.groupby(dfJoined[DFCOL_SPRENRET_SPSEUDO]).sum()
+
+def get_action_values(dfSASP, afterstate_values):
+    """Compute q(s,a) = W(s_pseudo(s,a)) - transfer fees for all states and their legitimate actions"""
+    dfQ = dfSASP[[DFCOL_SASP_SORIG, DFCOL_SASP_ACTION]].copy()
+    dfQ[DFCOL_SASP_Q] = dfSASP[DFCOL_SASP_SPSEUDO].map(afterstate_values) - dfSASP[DFCOL_SASP_FEES]
+    return dfQ
+
 def policy_evaluation(dfSASP, dfSp_Ren_Ret, dfV, dfPi, is_original_problem, seq_nr, disk_allowed=False, dir_path=None):
     while True:
-        delta = 0.
-        v, new_v = 0., 0.
+        # the afterstate values are computed once per sweep from the values of the previous sweep,
+        # so all states are updated at once (instead of in place, state by state)
+        afterstate_values = get_afterstate_values(dfSp_Ren_Ret, dfV)
+        dfQ = get_action_values(dfSASP, afterstate_values)
         
-        for index, row in dfV.iterrows():
-            # the current state, interpreted as original state, and its current value
-            orig_state, v = row[DFCOL_V_STATE], row[DFCOL_V_VALUE]
-                
-            # init the new value at 0. to keep adding partial values to it later
-            new_v = 0.
-            
-            # legitimate actions for the state vary dependent on mode
-            # we'll iterate through all legitimate actions, ignoring current greedy policy
-            legit_actions = dfSASP.loc[dfSASP[DFCOL_SASP_SORIG] == orig_state, DFCOL_SASP_ACTION].tolist()
-                
-            for action in legit_actions:
-                prob_pi = dfPi.loc[(dfPi[DFCOL_PI_STATE] == orig_state) & (dfPi[DFCOL_PI_ACTION] == action), DFCOL_PI_PROB].values[0]
-                if prob_pi > 0.: # the calculation only yields a non-0 value for non-0 probabilities per policy
-                    # the pseudo-state the original state and current action lead to, and the
-                    # penalty incurred by that action
-                    pseudo_state, action_penalty = dfSASP.loc[
-                        (dfSASP[DFCOL_SASP_SORIG] == orig_state) & (dfSASP[DFCOL_SASP_ACTION] == action), 
-                        [DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES]].values[0]
-                    
-                    # dataframe dfProbs holds the following columns from dfSp_Ren_Ret that correspond to the pseudo-state:
-                    # (1) all valid rental&return count combinations across locations
-                    # DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B, DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B, 
-                    # (2) their corresponding next state
-                    # DFCOL_SPRENRET_SNEXT
-                    # (3) their respective Poisson probabilities
-                    # DFCOL_SPRENRET_PROBSRSA, 
-                    # (4) their respective reward
-                    # DFCOL_SPRENRET_REWARD
-                    dfProbs = dfSp_Ren_Ret.loc[
-                        dfSp_Ren_Ret[DFCOL_SPRENRET_SPSEUDO] == pseudo_state, 
-                        [DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B, 
-                        DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B, 
-                        DFCOL_SPRENRET_SNEXT,
-                        DFCOL_SPRENRET_PROBSRSA, 
-                        DFCOL_SPRENRET_REWARD,
-                        DFCOL_SPRENRET_FEES]]
-                    
-                    # loop through dfProbs and add to the state's value the probability-weighted average of 
-                    # (reward plus discounted next-state value) over next states and their rewards
-                    dfJoined = pd.merge(dfProbs, dfV, how="left", left_on=DFCOL_SPRENRET_SNEXT, right_on=DFCOL_V_STATE)
-                
-                    new_v += ((
-                        dfJoined[DFCOL_SPRENRET_PROBSRSA] * (
-                            dfJoined[DFCOL_SPRENRET_REWARD] - action_penalty - dfJoined[DFCOL_SPRENRET_FEES] + GAMMA*dfJoined[DFCOL_V_VALUE]
-                        )
-                    ).sum() * prob_pi)
-            
-            # update dfV with the new value for this state
-            dfV.loc[index, DFCOL_V_VALUE] = new_v
-                
-            # keep record of the greatest yet delta between an old and a new state value within this iteration 
-            delta = max(delta, abs(v - new_v))
+        # the new value of every state is the probability-weighted average over its legitimate actions of q(s,a)
+        dfJoined = pd.merge(dfPi, dfQ, how="left", 
+                            left_on=[DFCOL_PI_STATE, DFCOL_PI_ACTION], right_on=[DFCOL_SASP_SORIG, DFCOL_SASP_ACTION])
+        new_v = (dfJoined[DFCOL_PI_PROB] * dfJoined[DFCOL_SASP_Q]).groupby(dfJoined[DFCOL_PI_STATE]).sum()
+        new_v = dfV[DFCOL_V_STATE].map(new_v).values
+        
+        # keep record of the greatest delta between an old and a new state value within this iteration 
+        delta = np.amax(np.abs(dfV[DFCOL_V_VALUE].values - new_v))
+        dfV[DFCOL_V_VALUE] = new_v
         
         if(delta - THETA < 0.): 
             # computed values are good enough
@@ -161,85 +135,32 @@ def policy_evaluation(dfSASP, dfSp_Ren_Ret, dfV, dfPi, is_original_problem, seq_
     return dfPi, dfV
     
 def policy_improvement(dfSASP, dfSp_Ren_Ret, dfV, dfPi, is_original_problem, seq_nr, disk_allowed=False, dir_path=None):
-    delta = 0.
-    v, new_v = 0., 0.
-    policy_stable = True
-    max_v = -100000.
+    afterstate_values = get_afterstate_values(dfSp_Ren_Ret, dfV)
+    dfQ = get_action_values(dfSASP, afterstate_values)
+    dfQ[DFCOL_SASP_Q] = dfQ[DFCOL_SASP_Q].round(5)
     
-    # create a dict of format {state:df_actions_and_probs}
-    groups = dict(list(dfPi.groupby(DFCOL_PI_STATE)))
-    for orig_state in groups:
-        dfState = groups[orig_state]
-        
-        max_v = -100000.
-        new_a = None
-        delta = 0.
-        
-        # the so far known maximizing action for this state
-        #dfState = dfPi.loc[dfPi[DFCOL_PI_STATE] == orig_state, [DFCOL_PI_ACTION, DFCOL_PI_PROB]]
-        a = dfState.loc[dfState[DFCOL_PI_PROB] == np.amax(dfState[DFCOL_PI_PROB]), DFCOL_PI_ACTION].values[0]
-        v = dfV.loc[dfV[DFCOL_V_STATE] == orig_state, DFCOL_V_VALUE].values[0]
-        
-        # legitimate actions for the state vary dependent on mode
-        # we'll iterate through all legitimate actions, ignoring current greedy policy
-        legit_actions = dfState[DFCOL_PI_ACTION].tolist()
-        # and we'll iterate in a specific order, and later round values to prefer smaller car transfers
-        legit_actions = sorted(legit_actions, key=action_sort)
-            
-        for action in legit_actions:
-            # the pseudo-state the original state and current action lead to, and the
-            # penalty incurred by that action
-            pseudo_state, action_penalty = dfSASP.loc[
-                (dfSASP[DFCOL_SASP_SORIG] == orig_state) & (dfSASP[DFCOL_SASP_ACTION] == action), 
-                [DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES]].values[0]
-            
-            # dataframe dfProbs holds the following columns from dfSp_Ren_Ret that correspond to the pseudo-state:
-            # (1) all valid rental&return count combinations across locations
-            # DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B, DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B, 
-            # (2) their corresponding next state
-            # DFCOL_SPRENRET_SNEXT
-            # (3) their respective Poisson probabilities
-            # DFCOL_SPRENRET_PROBSRSA, 
-            # (4) their respective reward
-            # DFCOL_SPRENRET_REWARD
-            dfProbs = dfSp_Ren_Ret.loc[
-                dfSp_Ren_Ret[DFCOL_SPRENRET_SPSEUDO] == pseudo_state, 
-                [DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B, 
-                 DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B, 
-                 DFCOL_SPRENRET_SNEXT,
-                 DFCOL_SPRENRET_PROBSRSA, 
-                 DFCOL_SPRENRET_REWARD,
-                 DFCOL_SPRENRET_FEES]]
-
-            # loop through dfProbs and look for the action that would maximize the state's value
-            new_v = 0.
-            
-            dfJoined = pd.merge(dfProbs, dfV, how="left", left_on=DFCOL_SPRENRET_SNEXT, right_on=DFCOL_V_STATE)
-            new_v = (
-                dfJoined[DFCOL_SPRENRET_PROBSRSA] * (
-                    dfJoined[DFCOL_SPRENRET_REWARD] - action_penalty - dfJoined[DFCOL_SPRENRET_FEES] + GAMMA*dfJoined[DFCOL_V_VALUE]
-                )
-            ).sum()
-
-            # if the computed state value is sufficiently larger than seen so far, then the current action is a maximizer;
-            # if it is not sufficiently larger, we stick with the previous maximizing action, which has a smaller car transfer number
-            new_v = round(new_v, 5)
-            if new_v - max_v > 0.:
-                max_v = new_v
-                new_a = action
-                
-                # keep record of the greatest yet delta between an old and a new state value within this state loop 
-                delta = max(delta, abs(v - new_v))
-                
-        # update the probabilities for the current state and all its possible actions in dfPi
-        num_actions = float(dfPi[dfPi[DFCOL_PI_STATE] == orig_state].shape[0])
-        prob_pref_action = 1. - EPSILON + (EPSILON/num_actions)
-        prob_other_action = EPSILON/num_actions
-        dfPi.loc[(dfPi[DFCOL_PI_STATE] == orig_state) & (dfPi[DFCOL_PI_ACTION] == new_a), DFCOL_PI_PROB] = prob_pref_action
-        dfPi.loc[(dfPi[DFCOL_PI_STATE] == orig_state) & (dfPi[DFCOL_PI_ACTION] != new_a), DFCOL_PI_PROB] = prob_other_action
-        
-        if a != new_a and delta - THETA > 0.: 
-            policy_stable = False
+    # we'll go through the legitimate actions of every state in a specific order, with values rounded, 
+    # so that an action with a larger car transfer is only a maximizer if its value is larger
+    dfQ["transfer_order"] = dfQ[DFCOL_SASP_ACTION].map(action_sort)
+    dfQ = dfQ.sort_values([DFCOL_SASP_SORIG, "transfer_order"], kind="stable")
+    q_by_state = dfQ.groupby(DFCOL_SASP_SORIG, sort=False)[DFCOL_SASP_Q]
+    
+    # the maximizing action per state is the first action with the largest value, and for every
+    # action that beat the maximum so far, we keep record of the delta between old and new state value
+    new_a = dfQ.loc[q_by_state.idxmax(), [DFCOL_SASP_SORIG, DFCOL_SASP_ACTION]].set_index(DFCOL_SASP_SORIG)[DFCOL_SASP_ACTION]
+    max_so_far = q_by_state.transform(lambda q: q.cummax().shift(fill_value=-100000.))
+    v = dfQ[DFCOL_SASP_SORIG].map(dfV.set_index(DFCOL_V_STATE)[DFCOL_V_VALUE])
+    delta = (v - dfQ[DFCOL_SASP_Q]).abs().where(dfQ[DFCOL_SASP_Q] - max_so_far > 0., 0.).groupby(dfQ[DFCOL_SASP_SORIG]).max()
+    
+    # the so far known maximizing action per state
+    a = dfPi.loc[dfPi.groupby(DFCOL_PI_STATE)[DFCOL_PI_PROB].idxmax(), [DFCOL_PI_STATE, DFCOL_PI_ACTION]].set_index(DFCOL_PI_STATE)[DFCOL_PI_ACTION]
+    
+    # update the probabilities for all states and their possible actions in dfPi
+    num_actions = dfPi.groupby(DFCOL_PI_STATE)[DFCOL_PI_ACTION].transform("size").astype(float)
+    is_pref_action = dfPi[DFCOL_PI_ACTION] == dfPi[DFCOL_PI_STATE].map(new_a)
+    dfPi[DFCOL_PI_PROB] = np.where(is_pref_action, 1. - EPSILON + (EPSILON/num_actions), EPSILON/num_actions)
+    
+    policy_stable = not ((a != new_a[a.index]) & (delta[a.index] - THETA > 0.)).any()
     
     if policy_stable == True:
         # the policy is considered stable enough, so last computed values remains valid
@@ -275,6 +196,148 @@ def policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=-1, v_seq_
         
     return dfPi, dfV
 
+def model_policy_evaluation(model, v, pi, max_sweeps=None):
+    """
+    Policy evaluation on the compiled TransitionModel: every sweep computes the afterstate values once 
+    and updates all states at once, v(s) = sum over a of pi(a|s) * q(s,a). Sweeps until the values change
+    by less than THETA, or max_sweeps sweeps (if given).
+    Returns the values, the number of sweeps and whether the values converged.
+    """
+    num_sweeps = 0
+    while True:
+        new_v = np.sum(pi * np.where(model.sa_valid, model.get_action_values(v, GAMMA), 0.), axis=1)
+        delta = np.amax(np.abs(new_v - v))
+        v = new_v
+        num_sweeps += 1
+        if delta - THETA < 0. or num_sweeps == max_sweeps: 
+            return v, num_sweeps, delta - THETA < 0.
+
+def model_policy_improvement(model, v, pi):
+    """
+    Policy improvement on the compiled TransitionModel, for all states at once. Like policy_improvement, 
+    actions are tried in ascending order of transferred cars and action values are rounded, so a larger 
+    transfer only becomes the maximizer if its value is larger.
+    Returns the improved policy and whether the policy is considered stable.
+    """
+    q = np.round(model.get_action_values(v, GAMMA), 5)
+    sorted_actions = np.array(sorted(range(model.num_actions), key=action_sort))
+    q_sorted = q[:, sorted_actions]
+    
+    # an action becomes the maximizer if its value beats the maximum of all actions tried before it
+    max_so_far = np.maximum.accumulate(np.hstack((np.full((model.num_states, 1), -100000.), q_sorted)), axis=1)[:, :-1]
+    is_new_max = q_sorted - max_so_far > 0.
+    delta = np.amax(np.where(is_new_max, np.abs(v[:, np.newaxis] - q_sorted), 0.), axis=1)
+    
+    a = np.argmax(pi, axis=1)
+    new_a = sorted_actions[np.argmax(q_sorted, axis=1)]
+    policy_stable = not np.any((a != new_a) & (delta - THETA > 0.))
+    return model.get_soft_policy(new_a), policy_stable
+
+def get_max_sweeps(solver, mpi_evaluation_sweeps):
+    """The evaluation sweeps per improvement of a solver: until THETA (None), k or a single one"""
+    if solver == SOLVER_POLICY_ITERATION: return None
+    elif solver == SOLVER_MODIFIED_POLICY_ITERATION: return mpi_evaluation_sweeps
+    elif solver == SOLVER_VALUE_ITERATION: return 1
+    raise ValueError("Unknown solver: " + str(solver))
+
+def model_solve(model, v, pi, max_sweeps=None, evaluate=True, commit_values=None, commit_policy=None):
+    """
+    Alternate policy evaluation of at most max_sweeps sweeps (until THETA if None) and policy improvement 
+    on a TransitionModel, until the policy is stable and its values have converged. This is policy iteration 
+    for max_sweeps=None, modified policy iteration for max_sweeps=k, and value iteration for max_sweeps=1: 
+    a single sweep under the policy that is greedy for the previous values is the (ε-soft) Bellman 
+    optimality backup. commit_values and commit_policy, if given, are called with every new v and pi.
+    Returns the values, the policy, and the number of improvements and evaluation sweeps.
+    """
+    num_improvements, total_sweeps, converged = 0, 0, not evaluate
+    while True:
+        if evaluate:
+            v, num_sweeps, converged = model_policy_evaluation(model, v, pi, max_sweeps)
+            total_sweeps += num_sweeps
+            if commit_values is not None: commit_values(v)
+            if max_sweeps is None: print_status("values deemed good enough after {} sweeps".format(num_sweeps))
+        evaluate = True
+        
+        pi, policy_stable = model_policy_improvement(model, v, pi)
+        num_improvements += 1
+        if policy_stable == True and converged == True:
+            print_status("policy considered stable enough")
+            break
+        if commit_policy is not None: commit_policy(pi)
+        if max_sweeps is None: print_status("a better policy was found, going for another value loop")
+    
+    return v, pi, num_improvements, total_sweeps
+
+def model_policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=-1, v_seq_nr=-1, disk_allowed=None, dir_path=None, 
+                           factorized=False, solver=SOLVER_POLICY_ITERATION, mpi_evaluation_sweeps=5):
+    """
+    Policy iteration like policy_iteration, but on dfSASP and dfSp_Ren_Ret compiled into a TransitionModel
+    once, so that evaluation sweeps and improvements are array operations over all states.
+    With factorized=True, the model keeps one transition matrix per location instead (FactorizedTransitionModel),
+    and dfSp_Ren_Ret isn't used.
+    solver selects policy iteration, modified policy iteration (mpi_evaluation_sweeps sweeps per improvement)
+    or value iteration (see model_solve); the number of sweeps and the wall time (excluding disk writes) are 
+    reported. Policy iteration commits dfV and dfPi after every evaluation and improvement, the other solvers
+    (with many short iterations) commit them once, when done.
+    """
+    assert (abs(pi_seq_nr - v_seq_nr) == 1) or (pi_seq_nr == -1 and v_seq_nr == -1)
+    if dir_path == None: dir_path = PATH_SPRENRET_CSV
+    
+    dfSASP, dfSp_Ren_Ret, dfV, dfPi, seq_nr = init_policy_iteration(
+        dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=pi_seq_nr, v_seq_nr=v_seq_nr, disk_allowed=disk_allowed, dir_path=dir_path)
+    model = FactorizedTransitionModel(dfSASP, is_orig_problem) if factorized == True else TransitionModel(dfSASP, dfSp_Ren_Ret)
+    print_status("compiled transition model")
+    v, pi = model.values_from_df(dfV), model.policy_from_df(dfPi)
+    
+    # dfV and dfPi files are numbered in the order they're committed; the time spent on it isn't the solver's
+    commit_seconds = 0.
+    def commit(df, file_type):
+        nonlocal seq_nr, commit_seconds
+        start_time = time.perf_counter()
+        commit_to_csv(df, file_type, is_orig_problem, seq_nr=seq_nr, dir_path=dir_path)
+        seq_nr = seq_nr + 1
+        commit_seconds += time.perf_counter() - start_time
+    commit_values = lambda v: commit(model.values_to_df(v), FileType.V)
+    commit_policy = lambda pi: commit(model.policy_to_df(pi), FileType.Pi)
+    commit_every_iteration = disk_allowed == True and solver == SOLVER_POLICY_ITERATION
+    
+    evaluate = (pi_seq_nr > v_seq_nr) or (pi_seq_nr == -1 and v_seq_nr == -1)
+    start_time = time.perf_counter()
+    v, pi, num_improvements, total_sweeps = model_solve(
+        model, v, pi, get_max_sweeps(solver, mpi_evaluation_sweeps), evaluate, 
+        commit_values if commit_every_iteration else None, commit_policy if commit_every_iteration else None)
+    print_status("{} done: {} improvements, {} evaluation sweeps, {:.2f}s".format(
+        solver, num_improvements, total_sweeps, time.perf_counter() - start_time - commit_seconds))
+    if disk_allowed == True and commit_every_iteration == False:
+        commit_values(v)
+        commit_policy(pi)
+    
+    return model.policy_to_df(pi), model.values_to_df(v)
+
+def compare_solvers(dfSASP, dfSp_Ren_Ret, is_orig_problem, mpi_evaluation_sweeps=(2, 5, 10), factorized=False):
+    """
+    Solve the problem with policy iteration, modified policy iteration (for every number of sweeps in 
+    mpi_evaluation_sweeps) and value iteration on one TransitionModel, without disk access.
+    Returns a dataframe with the improvements, evaluation sweeps and wall time per solver, and the largest
+    difference of its values and the number of states where its greedy action differs from policy iteration.
+    """
+    dfSASP, dfSp_Ren_Ret, dfV, dfPi, _ = init_policy_iteration(dfSASP, dfSp_Ren_Ret, is_orig_problem)
+    model = FactorizedTransitionModel(dfSASP, is_orig_problem) if factorized == True else TransitionModel(dfSASP, dfSp_Ren_Ret)
+    solvers = [(SOLVER_POLICY_ITERATION, None)] + \
+              [(SOLVER_MODIFIED_POLICY_ITERATION, k) for k in mpi_evaluation_sweeps] + [(SOLVER_VALUE_ITERATION, 1)]
+    
+    rows = []
+    for solver, k in solvers:
+        start_time = time.perf_counter()
+        v, pi, num_improvements, total_sweeps = model_solve(
+            model, model.values_from_df(dfV), model.policy_from_df(dfPi), get_max_sweeps(solver, k))
+        seconds = time.perf_counter() - start_time
+        if solver == SOLVER_POLICY_ITERATION: v_pi, pi_pi = v, pi
+        rows.append({"solver": solver, "sweeps_per_improvement": k, "improvements": num_improvements, 
+                     "sweeps": total_sweeps, "seconds": seconds, "max_value_diff": np.amax(np.abs(v - v_pi)), 
+                     "greedy_action_diff": np.sum(np.argmax(pi, axis=1) != np.argmax(pi_pi, axis=1))})
+    return pd.DataFrame(rows)
+
 # module testing code
 if __name__ == '__main__':
     v_seq_nr, pi_seq_nr = -1, -1
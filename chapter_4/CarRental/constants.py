@@ -19,6 +19,12 @@ USE_DISK_FOR_CSV_DATA = True
 # what directory to use for r/w of CSV files from/to disk
 PATH_SPRENRET_CSV = "C:/Temp/rlai-exercises/Chapter 4/data"
 
+# whether to r/w dfSASP and dfSp_Ren_Ret as binary column
+# arrays (.npy files, memory-mapped on load) instead of CSV
+# files; CSV files found on disk are still loaded if there's
+# no binary cache yet.
+USE_BINARY_CACHE = True
+
 # whether to load cached preprocessed data from CSV files
 # for purposes of quick visualization w/o a full code run
 # (dfSASP.csv, dfSp_Ren_Ret.csv).
@@ -39,6 +45,26 @@ GET_MODEL_FROM_CSV = False
 PI_SEQ_NR = -1
 V_SEQ_NR = -1
 
+# whether to run policy iteration on a transition model compiled
+# from dfSASP and dfSp_Ren_Ret into integer-indexed arrays
+# (seconds), or on the dataframes themselves (hours).
+USE_TRANSITION_MODEL = True
+
+# whether the transition model keeps one transition matrix per
+# location (the locations are independent given the pseudo-state)
+# instead of the joint one; this doesn't need dfSp_Ren_Ret at all.
+# Don't set this to TRUE if USE_TRANSITION_MODEL = False;
+FACTORIZE_TRANSITION_MODEL = False
+
+# which solver to run on the transition model: "policy_iteration"
+# (evaluation sweeps until THETA before every improvement),
+# "modified_policy_iteration" (MPI_EVALUATION_SWEEPS evaluation
+# sweeps per improvement) or "value_iteration" (a single sweep
+# per improvement). All of them end in the same dfPi and dfV.
+# Don't change this if USE_TRANSITION_MODEL = False;
+SOLVER = "policy_iteration"
+MPI_EVALUATION_SWEEPS = 5
+
 # =========================================================
 # Constants not exposed to the notebook start here
 # =========================================================
@@ -53,6 +79,25 @@ FILE_SPRENRET_PREFIX = "dfSp_Ren_Ret"
 FILE_PI_PREFIX = "dfPi"
 FILE_V_PREFIX = "dfV"
 
+# postfix of the sub-directories holding the binary cache of a
+# dataframe (one .npy file per column plus a header file)
+FOLDER_CACHE_POSTFIX = "_npy"
+FILE_CACHE_HEADER = "header.json"
+
+# header file name postfix for the CSV files of dfSASP and dfSp_Ren_Ret
+FILE_CSV_HEADER_POSTFIX = "_header.json"
+
+# stages of generating dfSASP and dfSp_Ren_Ret, each with their own
+# constants: the transitions (states, actions, rentals/returns and
+# their probabilities), and the rewards and fees
+STAGE_TRANSITIONS = "transitions"
+STAGE_REWARDS = "rewards"
+
+# solvers (see SOLVER above)
+SOLVER_POLICY_ITERATION = "policy_iteration"
+SOLVER_MODIFIED_POLICY_ITERATION = "modified_policy_iteration"
+SOLVER_VALUE_ITERATION = "value_iteration"
+
 EPSILON = .05
 GAMMA = .9
 THETA = .05
@@ -84,6 +129,7 @@ DFCOL_SASP_SORIG_B = "s_k_b"
 DFCOL_SASP_NUM_TRANSFERS = "count_transfers"
 DFCOL_SASP_SPSEUDO_A = "s_pseudo_k_a"
 DFCOL_SASP_SPSEUDO_B = "s_pseudo_k_b"
+DFCOL_SASP_Q = "q_of_sa" # q(s,a), given the current value function
 
 # Constants for the dataframe dfSp_ren_ret
 DFCOL_SPRENRET_SPSEUDO = "s_pseudo_k"
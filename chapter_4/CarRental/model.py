@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+from .constants import EPSILON
+from .constants import EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RENTALS_LOC_2
+from .constants import EXP_VALUE_RETURNS_LOC_1, EXP_VALUE_RETURNS_LOC_2
+from .constants import DFCOL_SASP_SORIG, DFCOL_SASP_ACTION, DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES
+from .constants import DFCOL_SPRENRET_SPSEUDO, DFCOL_SPRENRET_SNEXT, DFCOL_SPRENRET_PROBSRSA
+from .constants import DFCOL_SPRENRET_REWARD, DFCOL_SPRENRET_FEES
+from .constants import DFCOL_PI_STATE, DFCOL_PI_ACTION, DFCOL_PI_PROB
+from .constants import DFCOL_V_STATE, DFCOL_V_VALUE
+from .constants import MIN_NUMBER_OF_CARS_LOC_1, MIN_NUMBER_OF_CARS_LOC_2
+from .constants import MAX_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_2
+from .constants import MAX_NUMBER_OF_CARS_PER_TRANSFER
+from .probabilities import get_truncated_probs
+from .rewards import compute_reward, compute_parking_fees
+
+
+class TransitionModel():
+    """
+    Integer-indexed, dense form of dfSASP and dfSp_Ren_Ret, compiled once before policy iteration.
+    States (and pseudo-states, which range over the same car counts) are the state indices of
+    common.get_state_index, i.e. state (a, b) has index (a - min_a) * (number of b values) + (b - min_b).
+
+    p_next          p_next[ps, s'] is the probability p(s'|ps) of reaching s' from pseudo-state ps
+    exp_reward      expected reward from rentals less overflow parking fees per pseudo-state
+    sa_pseudo       the pseudo-state per (state, action), -1 for invalid actions
+    sa_fees         the transfer fees per (state, action)
+    sa_valid        whether the action is valid for the state
+    """
+    def __init__(self, dfSASP, dfSp_Ren_Ret):
+        self.init_state_actions(dfSASP)
+
+        # pseudo-state -> next state probabilities and expected immediate reward
+        ps = self.get_state_indices(dfSp_Ren_Ret[DFCOL_SPRENRET_SPSEUDO])
+        s_next = self.get_state_indices(dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT])
+        p = dfSp_Ren_Ret[DFCOL_SPRENRET_PROBSRSA].values.astype(float)
+        self.p_next = np.zeros((self.num_states, self.num_states))
+        np.add.at(self.p_next, (ps, s_next), p)
+        self.exp_reward = np.bincount(
+            ps, weights=p * (dfSp_Ren_Ret[DFCOL_SPRENRET_REWARD].values - dfSp_Ren_Ret[DFCOL_SPRENRET_FEES].values),
+            minlength=self.num_states)
+
+    def init_state_actions(self, dfSASP):
+        self.num_cars_b = MAX_NUMBER_OF_CARS_LOC_2 - MIN_NUMBER_OF_CARS_LOC_2 + 1
+        self.num_states = (MAX_NUMBER_OF_CARS_LOC_1 - MIN_NUMBER_OF_CARS_LOC_1 + 1) * self.num_cars_b
+        self.num_actions = MAX_NUMBER_OF_CARS_PER_TRANSFER*2 + 1 # all whole numbers in [-n, n]
+        self.states = np.arange(self.num_states)
+
+        # (state, action) -> pseudo-state and transfer fees
+        s = self.get_state_indices(dfSASP[DFCOL_SASP_SORIG])
+        a = dfSASP[DFCOL_SASP_ACTION].values.astype(int)
+        self.sa_pseudo = np.full((self.num_states, self.num_actions), -1, dtype=int)
+        self.sa_fees = np.zeros((self.num_states, self.num_actions))
+        self.sa_pseudo[s, a] = self.get_state_indices(dfSASP[DFCOL_SASP_SPSEUDO])
+        self.sa_fees[s, a] = dfSASP[DFCOL_SASP_FEES].values
+        self.sa_valid = self.sa_pseudo > -1
+
+    def get_state_indices(self, states):
+        return np.asarray(states, dtype=int)
+
+    def get_expected_next_values(self, v):
+        """E[v(s')|ps] for all pseudo-states ps given state values v"""
+        return self.p_next.dot(v)
+
+    def get_afterstate_values(self, v, gamma):
+        """W(ps) = expected reward less parking fees + gamma * E[v(s')|ps] for all pseudo-states ps"""
+        return self.exp_reward + gamma * self.get_expected_next_values(v)
+
+    def get_action_values(self, v, gamma):
+        """q(s, a) = W(pseudo-state of (s, a)) - transfer fees for all state-action pairs, -inf for invalid actions"""
+        q = self.get_afterstate_values(v, gamma)[np.where(self.sa_valid, self.sa_pseudo, 0)] - self.sa_fees
+        return np.where(self.sa_valid, q, -np.inf)
+
+    def get_soft_policy(self, greedy_actions):
+        """ε-soft policy that prefers greedy_actions[s] in every state s"""
+        num_valid_actions = np.sum(self.sa_valid, axis=1, keepdims=True)
+        pi = np.where(self.sa_valid, EPSILON/num_valid_actions, 0.)
+        pi[np.arange(self.num_states), greedy_actions] = 1. - EPSILON + EPSILON/num_valid_actions[:, 0]
+        return pi
+
+    def values_from_df(self, dfV):
+        v = np.zeros(self.num_states)
+        v[self.get_state_indices(dfV[DFCOL_V_STATE])] = dfV[DFCOL_V_VALUE].values
+        return v
+
+    def values_to_df(self, v):
+        return pd.DataFrame({DFCOL_V_STATE: self.states, DFCOL_V_VALUE: v})
+
+    def policy_from_df(self, dfPi):
+        pi = np.zeros((self.num_states, self.num_actions))
+        pi[self.get_state_indices(dfPi[DFCOL_PI_STATE]), dfPi[DFCOL_PI_ACTION].values.astype(int)] = dfPi[DFCOL_PI_PROB].values
+        return pi
+
+    def policy_to_df(self, pi):
+        s, a = np.nonzero(self.sa_valid)
+        return pd.DataFrame({DFCOL_PI_STATE: s, DFCOL_PI_ACTION: a, DFCOL_PI_PROB: pi[s, a]})
+
+def get_location_model(max_cars, exp_rentals, exp_returns, get_parking_fees):
+    """
+    Transition matrix p[x, y] from x cars at a location in the morning (after transfers) to y cars 
+    at the end of the day, and the expected rentals and parking fees for x cars in the morning. 
+    Rentals are capped at x and returns at max_cars - x cars, with the tail probabilities lumped 
+    into the capped number, just like in dfSp_Ren_Ret.
+    """
+    p = np.zeros((max_cars + 1, max_cars + 1))
+    exp_num_rentals = np.zeros(max_cars + 1)
+    for x in range(max_cars + 1):
+        p_rentals = get_truncated_probs(exp_rentals, x)
+        p_returns = get_truncated_probs(exp_returns, max_cars - x)
+        # y = x - rentals + returns for every combination of rentals and returns
+        np.add.at(p[x], x - np.arange(x + 1)[:, np.newaxis] + np.arange(max_cars - x + 1), np.outer(p_rentals, p_returns))
+        exp_num_rentals[x] = np.dot(np.arange(x + 1), p_rentals)
+    parking_fees = np.array([get_parking_fees(y) for y in range(max_cars + 1)])
+    return p, exp_num_rentals, p.dot(parking_fees)
+
+class FactorizedTransitionModel(TransitionModel):
+    """
+    TransitionModel that exploits the independence of the two locations: given the pseudo-state (x_a, x_b),
+    the numbers of cars at A and B at the end of the day are independent, so p(s'|ps) is the product of a 
+    transition matrix per location, and E[v(s')] for all pseudo-states is p_a · V · p_bᵀ with V the values
+    as a (cars at A, cars at B) matrix. Rewards and parking fees are sums of per-location terms as well.
+    Built from the constants rather than dfSp_Ren_Ret, whose joint rows it doesn't need.
+    """
+    def __init__(self, dfSASP, is_orig_problem):
+        if MIN_NUMBER_OF_CARS_LOC_1 != 0 or MIN_NUMBER_OF_CARS_LOC_2 != 0:
+            # the per-location matrices are indexed by the number of cars
+            raise ValueError("FactorizedTransitionModel requires MIN_NUMBER_OF_CARS_LOC_1 == "
+                             "MIN_NUMBER_OF_CARS_LOC_2 == 0, got %d and %d"
+                             % (MIN_NUMBER_OF_CARS_LOC_1, MIN_NUMBER_OF_CARS_LOC_2))
+        self.init_state_actions(dfSASP)
+
+        self.p_a, exp_rentals_a, exp_fees_a = get_location_model(
+            MAX_NUMBER_OF_CARS_LOC_1, EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RETURNS_LOC_1,
+            lambda y: compute_parking_fees(y, 0, is_orig_problem))
+        self.p_b, exp_rentals_b, exp_fees_b = get_location_model(
+            MAX_NUMBER_OF_CARS_LOC_2, EXP_VALUE_RENTALS_LOC_2, EXP_VALUE_RETURNS_LOC_2,
+            lambda y: compute_parking_fees(0, y, is_orig_problem))
+        self.exp_reward = (
+            (compute_reward(exp_rentals_a) - exp_fees_a)[:, np.newaxis] + (compute_reward(exp_rentals_b) - exp_fees_b)).ravel()
+
+    def get_expected_next_values(self, v):
+        return self.p_a.dot(v.reshape(self.p_a.shape[0], self.p_b.shape[0])).dot(self.p_b.T).ravel()
@@ -9,8 +9,7 @@ from .constants import MAX_NUMBER_OF_CARS_PER_TRANSFER
 
 def transform_data(dfPi, dfV):
     # Transform the resulting policy and value data
-    dfV[[DFCOL_V_STATE_A, DFCOL_V_STATE_B]] = dfV.apply(
-        lambda d: get_state_components(d[DFCOL_V_STATE]), axis=1, result_type="expand")    
+    dfV[DFCOL_V_STATE_A], dfV[DFCOL_V_STATE_B] = get_state_components(dfV[DFCOL_V_STATE])
     dfV_pivoted = dfV.pivot(index=DFCOL_V_STATE_A, columns=DFCOL_V_STATE_B, values=DFCOL_V_VALUE)
 
     groups = dict(list(dfPi.groupby(DFCOL_PI_STATE)))
@@ -23,8 +22,7 @@ def transform_data(dfPi, dfV):
         {DFCOL_PI_STATE : list(groups.keys()),
         DFCOL_PI_ACTION: max_actions},
         index = list(range(len(groups))))
-    dfPi_s[[DFCOL_PI_STATE_A, DFCOL_PI_STATE_B]] = dfPi_s.apply(
-        lambda d: get_state_components(d[DFCOL_PI_STATE]), axis=1, result_type="expand")
+    dfPi_s[DFCOL_PI_STATE_A], dfPi_s[DFCOL_PI_STATE_B] = get_state_components(dfPi_s[DFCOL_PI_STATE])
     
     # additionally, map action codes in dfPi_s_pivoted to # cars to be transferred
     num_actions = MAX_NUMBER_OF_CARS_PER_TRANSFER*2 + 1 # all whole numbers in [-n, n]
@@ -2,7 +2,7 @@ import numpy as np
 import pandas as pd
 
 from .common import FileType, commit_to_csv
-from .common import get_state_name, print_status
+from .common import get_state_index, print_status
 from .constants import DFCOL_SASP_SORIG, DFCOL_SASP_ACTION, DFCOL_SASP_SPSEUDO, DFCOL_SASP_FEES
 from .constants import DFCOL_SASP_SPSEUDO_A, DFCOL_SASP_SPSEUDO_B, DFCOL_SASP_IS_VALID
 from .constants import DFCOL_SPRENRET_SPSEUDO
@@ -15,16 +15,18 @@ from .constants import DFCOL_SPRENRET_SNEXT_A, DFCOL_SPRENRET_SNEXT_B
 from .constants import DFCOL_SPRENRET_REWARD, DFCOL_SPRENRET_FEES
 from .constants import EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RENTALS_LOC_2
 from .constants import EXP_VALUE_RETURNS_LOC_1, EXP_VALUE_RETURNS_LOC_2
-from .constants import MAX_NUMBER_OF_CARS_PER_TRANSFER
+from .constants import MAX_NUMBER_OF_CARS_PER_TRANSFER, UNIT_COST_OF_TRANSFER
+from .constants import REWARD_PER_RENTAL, FEES_PER_PARKING_NIGHT
 from .constants import MIN_NUMBER_OF_CARS_LOC_1, MIN_NUMBER_OF_CARS_LOC_2
 from .constants import MAX_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_2
 from .constants import IS_ORIGINAL_PROBLEM
-from .probabilities import lookup_prob_vectorized
+from .constants import STAGE_TRANSITIONS, STAGE_REWARDS
+from .probabilities import prob_cube, prob_cube_rates
 from .rewards import compute_reward, compute_parking_fees, compute_transfer_fees
 
 def get_RenRet_columns():
     return {
-        DFCOL_SPRENRET_SPSEUDO: str, 
+        DFCOL_SPRENRET_SPSEUDO: int, 
         DFCOL_SPRENRET_RENTALS_A: int, DFCOL_SPRENRET_RENTALS_B: int,
         DFCOL_SPRENRET_RETURNS_A: int, DFCOL_SPRENRET_RETURNS_B: int,
         DFCOL_SPRENRET_PROB_RENTALS_A: float, DFCOL_SPRENRET_PROB_RENTALS_B: float, 
@@ -34,13 +36,6 @@ def get_RenRet_columns():
         DFCOL_SPRENRET_FEES: int
     }
 
-def init_temp_df(data):
-    """Initialize a temporary dataframe for SpRenRet computation"""
-    column_dict=get_RenRet_columns()
-    dftemp = pd.DataFrame(data, columns=column_dict.keys())
-    dftemp = dftemp.astype(column_dict)
-    return dftemp
-
 num_states = 0
 all_sub_states_a, all_sub_states_b = [], []
 all_states = []
@@ -70,12 +65,8 @@ def prep_dfSASP(is_orig_problem):
     all_sub_states_b = list(range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2 + 1))
     all_states = np.array(np.meshgrid(all_sub_states_a, all_sub_states_b)).T.reshape(-1,2)
 
-    state_names = np.array(["xx_xx"] * num_states)
-    for i in range(num_states):
-        state_name = get_state_name(str(all_states[i,0].item()), str(all_states[i,1].item()))
-        state_names[i] = state_name
-
-    all_states = np.hstack((all_states, np.atleast_2d(state_names).T))
+    state_indices = get_state_index(all_states[:,0], all_states[:,1])
+    all_states = np.hstack((all_states, np.atleast_2d(state_indices).T))
     dict_states_a = dict(zip(all_states[:,-1], all_states[:,0]))
     dict_states_b = dict(zip(all_states[:,-1], all_states[:,1]))
 
@@ -108,18 +99,8 @@ def prep_dfSASP(is_orig_problem):
     # compute # cars at location B for the pseudo state': DFCOL_SARS_SPSEUDO_B
     dfSASP[DFCOL_SASP_SPSEUDO_B] = dfSASP[DFCOL_SASP_SORIG].map(dict_states_b).astype(int) + dfSASP[DFCOL_SASP_ACTION].map(dict_actions).astype(int)
 
-    # Re-cast the columns as specific types to allow string operations
-    dfSASP = dfSASP.astype({DFCOL_SASP_SPSEUDO_A: str, 
-                            DFCOL_SASP_SPSEUDO_B: str})
-
     # compute the pseudo state (as of 6am - following transfers but prior to new rentals/returns)
-    dfSASP[DFCOL_SASP_SPSEUDO] = dfSASP.apply(
-        lambda d: get_state_name(str(d[DFCOL_SASP_SPSEUDO_A]), str(d[DFCOL_SASP_SPSEUDO_B])),
-        axis=1)
-
-    # Re-cast the columns as specific types to allow arithmetic operations
-    dfSASP = dfSASP.astype({DFCOL_SASP_SPSEUDO_A: int, 
-                            DFCOL_SASP_SPSEUDO_B: int})
+    dfSASP[DFCOL_SASP_SPSEUDO] = get_state_index(dfSASP[DFCOL_SASP_SPSEUDO_A], dfSASP[DFCOL_SASP_SPSEUDO_B])
 
     dfSASP.loc[dfSASP[DFCOL_SASP_SPSEUDO_A] < MIN_NUMBER_OF_CARS_LOC_1, [DFCOL_SASP_IS_VALID]] = False
     dfSASP.loc[dfSASP[DFCOL_SASP_SPSEUDO_B] < MIN_NUMBER_OF_CARS_LOC_2, [DFCOL_SASP_IS_VALID]] = False
@@ -132,11 +113,67 @@ def prep_dfSASP(is_orig_problem):
     dfSASP = dfSASP.sort_values(DFCOL_SASP_SPSEUDO)
 
     # compute fees for a (incurred by transfer)
-    #dfSASP[DFCOL_SASP_FEES] = abs(dfSASP[DFCOL_SASP_ACTION].map(dict_actions).astype(int)*UNIT_COST_OF_TRANSFER)
-    dfSASP[DFCOL_SASP_FEES] = dfSASP[DFCOL_SASP_ACTION].map(dict_actions).apply(compute_transfer_fees, args=(is_orig_problem,))
+    dfSASP = update_dfSASP_fees(dfSASP, is_orig_problem)
     
     return dfSASP
 
+def update_dfSASP_fees(dfSASP, is_orig_problem):
+    """(Re)compute the transfer fees column of dfSASP; the action index a stands for a - <max transfers> cars transferred"""
+    dfSASP[DFCOL_SASP_FEES] = (dfSASP[DFCOL_SASP_ACTION] - MAX_NUMBER_OF_CARS_PER_TRANSFER).apply(
+        compute_transfer_fees, args=(is_orig_problem,))
+    return dfSASP
+
+def get_dfSASP_constants(is_orig_problem):
+    """
+    The constants dfSASP is generated from, per stage: the valid state/action/pseudo-state combinations
+    and the transfer fees (see update_dfSASP_fees)
+    """
+    return {
+        STAGE_TRANSITIONS: {
+            "MIN_NUMBER_OF_CARS_LOC_1": MIN_NUMBER_OF_CARS_LOC_1, "MIN_NUMBER_OF_CARS_LOC_2": MIN_NUMBER_OF_CARS_LOC_2,
+            "MAX_NUMBER_OF_CARS_LOC_1": MAX_NUMBER_OF_CARS_LOC_1, "MAX_NUMBER_OF_CARS_LOC_2": MAX_NUMBER_OF_CARS_LOC_2,
+            "MAX_NUMBER_OF_CARS_PER_TRANSFER": MAX_NUMBER_OF_CARS_PER_TRANSFER
+        },
+        STAGE_REWARDS: {
+            "IS_ORIGINAL_PROBLEM": is_orig_problem,
+            "UNIT_COST_OF_TRANSFER": UNIT_COST_OF_TRANSFER
+        }
+    }
+
+def get_dfSpRenRet_constants(is_orig_problem):
+    """
+    The constants dfSp_Ren_Ret is generated from, per stage: the rentals/returns, their probabilities and
+    the next states, and the rewards and parking fees (see update_dfSpRenRet_rewards)
+    """
+    return {
+        STAGE_TRANSITIONS: {
+            "MIN_NUMBER_OF_CARS_LOC_1": MIN_NUMBER_OF_CARS_LOC_1, "MIN_NUMBER_OF_CARS_LOC_2": MIN_NUMBER_OF_CARS_LOC_2,
+            "MAX_NUMBER_OF_CARS_LOC_1": MAX_NUMBER_OF_CARS_LOC_1, "MAX_NUMBER_OF_CARS_LOC_2": MAX_NUMBER_OF_CARS_LOC_2,
+            "EXP_VALUE_RENTALS_LOC_1": EXP_VALUE_RENTALS_LOC_1, "EXP_VALUE_RENTALS_LOC_2": EXP_VALUE_RENTALS_LOC_2,
+            "EXP_VALUE_RETURNS_LOC_1": EXP_VALUE_RETURNS_LOC_1, "EXP_VALUE_RETURNS_LOC_2": EXP_VALUE_RETURNS_LOC_2
+        },
+        STAGE_REWARDS: {
+            "IS_ORIGINAL_PROBLEM": is_orig_problem,
+            "REWARD_PER_RENTAL": REWARD_PER_RENTAL,
+            "FEES_PER_PARKING_NIGHT": FEES_PER_PARKING_NIGHT
+        }
+    }
+
+def get_parking_fees(next_state_a, next_state_b, is_orig_problem):
+    """The overflow parking fees for arrays of next state components, looked up in a table of all next states"""
+    parking_fees = np.array([[compute_parking_fees(a, b, is_orig_problem) 
+                              for b in range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2 + 1)] 
+                             for a in range(MIN_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_1 + 1)])
+    return parking_fees[next_state_a - MIN_NUMBER_OF_CARS_LOC_1, next_state_b - MIN_NUMBER_OF_CARS_LOC_2]
+
+def update_dfSpRenRet_rewards(dfSp_Ren_Ret, is_orig_problem):
+    """(Re)compute the reward and parking fees columns of dfSp_Ren_Ret"""
+    dfSp_Ren_Ret[DFCOL_SPRENRET_REWARD] = compute_reward(
+        dfSp_Ren_Ret[DFCOL_SPRENRET_RENTALS_A].values + dfSp_Ren_Ret[DFCOL_SPRENRET_RENTALS_B].values)
+    dfSp_Ren_Ret[DFCOL_SPRENRET_FEES] = get_parking_fees(
+        dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT_A].values, dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT_B].values, is_orig_problem)
+    return dfSp_Ren_Ret
+
 def prep_dfSpRenRet(is_orig_problem):
     """
     Populate a dataframe with all valid combinations of pseudo-state and rentals/returns. Validity is bound 
@@ -161,105 +198,70 @@ def prep_dfSpRenRet(is_orig_problem):
     s_k_plus_1_b        The resulting number of cars at location B at the end of the day
     s_k_plus_1          The next state s'
     """
-    # Calculate the row count for the dfSp_Ren_Ret dataframe
-    num_states = (MAX_NUMBER_OF_CARS_LOC_1 - MIN_NUMBER_OF_CARS_LOC_1 + 1) * (MAX_NUMBER_OF_CARS_LOC_2 - MIN_NUMBER_OF_CARS_LOC_2 + 1)
+    # all (pseudo-state count, rentals, returns) combinations per location, with their probabilities
+    ps_a, ren_a, ret_a, p_ren_a, p_ret_a = get_location_renret(
+        MIN_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_1, EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RETURNS_LOC_1)
+    ps_b, ren_b, ret_b, p_ren_b, p_ret_b = get_location_renret(
+        MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2, EXP_VALUE_RENTALS_LOC_2, EXP_VALUE_RETURNS_LOC_2)
     
-    # Calculate all states
-    all_sub_states_a = list(range(MIN_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_1 + 1))
-    all_sub_states_b = list(range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2 + 1))
-    all_states = np.array(np.meshgrid(all_sub_states_a, all_sub_states_b)).T.reshape(-1,2)
-
-    state_names = np.array(["xx_xx"] * num_states)
-    for i in range(num_states):
-        state_name = get_state_name(str(all_states[i,0].item()), str(all_states[i,1].item()))
-        state_names[i] = state_name
-
-    all_states = np.hstack((all_states, np.atleast_2d(state_names).T))
-    dict_states_a = dict(zip(all_states[:,-1], all_states[:,0]))
-    dict_states_b = dict(zip(all_states[:,-1], all_states[:,1]))
-
-    # Calculate all rental and return values
-    all_renret_values_a = np.array(list(range(MIN_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_1 + 1)))
-    all_renret_values_b = np.array(list(range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2 + 1)))
-    print_status("pre-processing done")
-
-    # Calculate all valid combinations of pseudo state, returns and rentals
-    column_dict = get_RenRet_columns()
-    dfSp_Ren_Ret = pd.DataFrame(columns=column_dict.keys())
-
-    ren_a, ren_b = [], []
-    ret_a, ret_b = [], []
-
-    for ps_a in range(MIN_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_1+1):
-        for ps_b in range(MIN_NUMBER_OF_CARS_LOC_2, MAX_NUMBER_OF_CARS_LOC_2+1):
-            ren_a = range(ps_a+1)
-            ren_b = range(ps_b+1)
-            ret_a = range(MAX_NUMBER_OF_CARS_LOC_1-ps_a+1)
-            ret_b = range(MAX_NUMBER_OF_CARS_LOC_2-ps_b+1)
-            
-            cart_prod = np.array(np.meshgrid(
-                [get_state_name(str(ps_a), str(ps_b))], 
-                list(ren_a), list(ren_b), list(ret_a), list(ret_b)
-            )).T.reshape(-1,5)
-            rest = np.zeros(shape=(cart_prod.shape[0], len(column_dict) - 5), dtype='int')
-            cart_prod = np.concatenate((cart_prod, rest), axis=1)
-            
-            # re-initialize the dftemp data frame
-            dftemp = init_temp_df(cart_prod)
-            
-            # write the granular probabilities
-            exp_numbers = [EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RENTALS_LOC_2, EXP_VALUE_RETURNS_LOC_1, EXP_VALUE_RETURNS_LOC_2]
-            for i in range(4):
-                probs = lookup_prob_vectorized(dftemp.iloc[:, 1+i], exp_numbers[i])
-                dftemp.iloc[:, 5+i] = probs
-                
-            # compute and write the joint probability
-            prob_rentals = np.multiply(dftemp.iloc[:, 5], dftemp.iloc[:, 6])
-            prob_returns = np.multiply(dftemp.iloc[:, 7], dftemp.iloc[:, 8])
-            dftemp.iloc[:, 9] = np.multiply(prob_rentals.iloc[:], prob_returns.iloc[:])
-            
-            # compute the rewards for rentals
-            dftemp.iloc[:, 10] = compute_reward(dftemp.iloc[:, 1] + dftemp.iloc[:, 2])   
-            
-            dfSp_Ren_Ret = dfSp_Ren_Ret.append(pd.DataFrame(dftemp, columns=column_dict.keys()))
-    print_status("dataframe creation done")
+    # the valid combinations for both locations are all pairs of valid combinations per location,
+    # sorted by pseudo-state, rentals at A and B, returns at A and B
+    rows_a, rows_b = np.meshgrid(np.arange(len(ps_a)), np.arange(len(ps_b)), indexing="ij")
+    rows_a, rows_b = rows_a.ravel(), rows_b.ravel()
+    order = np.lexsort((ret_b[rows_b], ret_a[rows_a], ren_b[rows_b], ren_a[rows_a], ps_b[rows_b], ps_a[rows_a]))
+    rows_a, rows_b = rows_a[order], rows_b[order]
+    print_status("valid combinations computed")
     
-    dfSp_Ren_Ret.set_index([DFCOL_SPRENRET_SPSEUDO,
-                DFCOL_SPRENRET_RENTALS_A, DFCOL_SPRENRET_RENTALS_B,
-                DFCOL_SPRENRET_RETURNS_A, DFCOL_SPRENRET_RETURNS_B], inplace=True)
-    dfSp_Ren_Ret.sort_index(inplace=True)
-    dfSp_Ren_Ret.reset_index(inplace=True)
-    print_status("dataframe multi-index set, sorted and removed")
-
     # compute the next state, s', from (s_pseudo, rentals_a, rentals_b, returns_a, returns_b)
-    dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT_A] = \
-        dfSp_Ren_Ret[DFCOL_SPRENRET_SPSEUDO].map(dict_states_a).astype(int) - \
-        dfSp_Ren_Ret[DFCOL_SPRENRET_RENTALS_A] + dfSp_Ren_Ret[DFCOL_SPRENRET_RETURNS_A]
-    dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT_B] = \
-        dfSp_Ren_Ret[DFCOL_SPRENRET_SPSEUDO].map(dict_states_b).astype(int) - \
-        dfSp_Ren_Ret[DFCOL_SPRENRET_RENTALS_B] + dfSp_Ren_Ret[DFCOL_SPRENRET_RETURNS_B]
-    print_status("next state computed")
-
-    # Compute the next state's name
-    dfSp_Ren_Ret[DFCOL_SPRENRET_SNEXT] = dfSp_Ren_Ret.apply(
-        lambda d: get_state_name(str(d[DFCOL_SPRENRET_SNEXT_A]), str(d[DFCOL_SPRENRET_SNEXT_B])),
-        axis=1)
-    print_status("next state named")
+    snext_a = ps_a[rows_a] - ren_a[rows_a] + ret_a[rows_a]
+    snext_b = ps_b[rows_b] - ren_b[rows_b] + ret_b[rows_b]
     
-    dfSp_Ren_Ret[DFCOL_SPRENRET_FEES] = dfSp_Ren_Ret.apply(
-        lambda d: compute_parking_fees(
-            d[DFCOL_SPRENRET_SNEXT_A], d[DFCOL_SPRENRET_SNEXT_B], is_orig_problem),
-        axis=1) 
-    print_status("fees computed")
+    prob_rentals = p_ren_a[rows_a] * p_ren_b[rows_b]
+    prob_returns = p_ret_a[rows_a] * p_ret_b[rows_b]
+    dfSp_Ren_Ret = pd.DataFrame({
+        DFCOL_SPRENRET_SPSEUDO: get_state_index(ps_a[rows_a], ps_b[rows_b]),
+        DFCOL_SPRENRET_RENTALS_A: ren_a[rows_a], DFCOL_SPRENRET_RENTALS_B: ren_b[rows_b],
+        DFCOL_SPRENRET_RETURNS_A: ret_a[rows_a], DFCOL_SPRENRET_RETURNS_B: ret_b[rows_b],
+        DFCOL_SPRENRET_PROB_RENTALS_A: p_ren_a[rows_a], DFCOL_SPRENRET_PROB_RENTALS_B: p_ren_b[rows_b],
+        DFCOL_SPRENRET_PROB_RETURNS_A: p_ret_a[rows_a], DFCOL_SPRENRET_PROB_RETURNS_B: p_ret_b[rows_b],
+        DFCOL_SPRENRET_PROBSRSA: prob_rentals * prob_returns,
+        DFCOL_SPRENRET_REWARD: compute_reward(ren_a[rows_a] + ren_b[rows_b]),
+        DFCOL_SPRENRET_FEES: get_parking_fees(snext_a, snext_b, is_orig_problem),
+        DFCOL_SPRENRET_SNEXT_A: snext_a,
+        DFCOL_SPRENRET_SNEXT_B: snext_b,
+        DFCOL_SPRENRET_SNEXT: get_state_index(snext_a, snext_b)
+    })
+    dfSp_Ren_Ret = dfSp_Ren_Ret.astype(get_RenRet_columns())
+    print_status("dataframe creation done")
     
     return dfSp_Ren_Ret
 
+def get_location_renret(min_cars, max_cars, exp_rentals, exp_returns):
+    """
+    Compute all valid combinations of the number of cars at a single location in the pseudo-state, rentals
+    and returns, sorted in this order, along with the probabilities of the rentals and the returns.
+    Rentals are capped at the cars available and returns at the free capacity, with the capped number 
+    also covering all larger numbers.
+    """
+    ps, rentals, returns = [], [], []
+    for x in range(min_cars, max_cars + 1):
+        ren, ret = np.meshgrid(np.arange(x + 1), np.arange(max_cars - x + 1), indexing="ij")
+        ps.append(np.full(ren.size, x))
+        rentals.append(ren.ravel())
+        returns.append(ret.ravel())
+    ps, rentals, returns = np.concatenate(ps), np.concatenate(rentals), np.concatenate(returns)
+    
+    p_rentals = prob_cube[prob_cube_rates.index(exp_rentals), rentals, ps]
+    p_returns = prob_cube[prob_cube_rates.index(exp_returns), returns, max_cars - ps]
+    return ps, rentals, returns, p_rentals, p_returns
+
 # module testing code
 if __name__ == '__main__':
     dfSASP = prep_dfSASP(IS_ORIGINAL_PROBLEM)
-    commit_to_csv(dfSASP, FileType.SASP, IS_ORIGINAL_PROBLEM)
+    commit_to_csv(dfSASP, FileType.SASP, IS_ORIGINAL_PROBLEM, generating_constants=get_dfSASP_constants(IS_ORIGINAL_PROBLEM))
     #print(dfSASP.head(20))
     
     dfSp_Ren_Ret = prep_dfSpRenRet(IS_ORIGINAL_PROBLEM)
-    commit_to_csv(dfSp_Ren_Ret, FileType.Sp_Ren_Ret, IS_ORIGINAL_PROBLEM)
+    commit_to_csv(dfSp_Ren_Ret, FileType.Sp_Ren_Ret, IS_ORIGINAL_PROBLEM, 
+                  generating_constants=get_dfSpRenRet_constants(IS_ORIGINAL_PROBLEM))
     #print(dfSp_Ren_Ret.head(20))
\ No newline at end of file
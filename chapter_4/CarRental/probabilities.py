@@ -11,34 +11,25 @@ def get_probsrsa_vectorized(number, exp_rate):
     """Vectorized Poisson probability computation"""
     return (np.power(exp_rate, number))*(np.exp(-exp_rate))/(scipy.special.factorial(number))
 
-def init_prob_lookup():
-    """Prepare a dtype=float lookup table for rental/return Poisson probabilities per expected number and number"""
-    poss_numbers = range(max(MAX_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_2) + 1)
-    exp_numbers = [EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RENTALS_LOC_2, EXP_VALUE_RETURNS_LOC_1, EXP_VALUE_RETURNS_LOC_2]
-        
-    # create a cartesian product of expected numbers and rental/return numbers
-    prob_lookup = np.array(np.meshgrid(poss_numbers, exp_numbers, [0.])).T.reshape(-1,3)
-    prob_lookup[:,2] = get_probsrsa_vectorized(prob_lookup[:,0], prob_lookup[:,1])
-    return prob_lookup
-
-prob_lookup = init_prob_lookup()
+def init_prob_cube():
+    """
+    Prepare a dtype=float cube of truncated Poisson probabilities prob_cube[rate_i, number, cap] of _number_ 
+    rentals/returns at rate prob_cube_rates[rate_i] when at most _cap_ of them are possible: the Poisson 
+    probability for number < cap, the tail probability P(N >= cap) for number = cap (so that sum_prob = 1),
+    and 0 for number > cap.
+    """
+    rates = sorted(set([EXP_VALUE_RENTALS_LOC_1, EXP_VALUE_RENTALS_LOC_2, EXP_VALUE_RETURNS_LOC_1, EXP_VALUE_RETURNS_LOC_2]))
+    numbers = np.arange(max(MAX_NUMBER_OF_CARS_LOC_1, MAX_NUMBER_OF_CARS_LOC_2) + 1)
+    
+    probs = get_probsrsa_vectorized(numbers, np.array(rates, dtype=float)[:, np.newaxis])
+    prob_cube = np.where(numbers[:, np.newaxis] < numbers, probs[:, :, np.newaxis], 0.)
+    # P(N >= cap) is the regularized lower incomplete gamma function P(cap, rate), and 1 for cap = 0
+    prob_cube[:, numbers, numbers] = np.where(
+        numbers > 0, scipy.special.gammainc(np.maximum(numbers, 1), np.array(rates, dtype=float)[:, np.newaxis]), 1.)
+    return rates, prob_cube
 
-def lookup_prob(number, exp_number):
-    """Look up the probability of _number_ rentals/returns for rate=_exp_number_"""
-    result = prob_lookup[:, 2][(prob_lookup[:,0].astype(int) == number) & (prob_lookup[:,1].astype(int) == exp_number)]
-    return np.unique(result)
+prob_cube_rates, prob_cube = init_prob_cube()
 
-def lookup_prob_vectorized(numbers, exp_number):
-    """Vectorized Poisson probability lookup, stretched to ensure sum_prob = 1"""
-    _, unique_indices = np.unique(numbers, return_index=True)
-    max_indices = np.where(numbers == np.amax(numbers)) # take the index of the largest number
-    probs = [0.] * len(numbers)
-    for i in range(len(numbers)):
-        if not np.isin(i, max_indices):
-            probs[i] = lookup_prob(numbers[i], exp_number)
-    
-    probs_sum_so_far = np.sum(np.take(probs, unique_indices))
-    for i in range(len(numbers)):
-        if np.isin(i, max_indices):
-            probs[i] = 1. - probs_sum_so_far
-    return probs
\ No newline at end of file
+def get_truncated_probs(exp_number, max_number):
+    """Poisson probabilities of 0..max_number rentals/returns, with the tail lumped into max_number to ensure sum_prob = 1"""
+    return prob_cube[prob_cube_rates.index(exp_number), :max_number + 1, max_number]
\ No newline at end of file
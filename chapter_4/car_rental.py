@@ -3,6 +3,53 @@ import os
 import pandas as pd
 from CarRental import common, compute, constants, plot, postprocess, preprocess
 
+def load_data(file_type, is_orig_problem, dir_path, use_binary_cache):
+    """
+    Load pre-processed data from its binary cache or else from its CSV file; returns the data, 
+    its header (None if it has none) and whether it came from CSV
+    """
+    if use_binary_cache == True:
+        df, header = common.load_from_cache(file_type, is_orig_problem, dir_path=dir_path)
+        if not df.empty: return df, header, False
+    df = common.load_from_csv(file_type, is_orig_problem, dir_path=dir_path)
+    return df, common.load_csv_header(file_type, is_orig_problem, dir_path=dir_path), True
+
+def commit_data(df, file_type, is_orig_problem, dir_path, use_binary_cache, generating_constants, columns=None):
+    """Commit pre-processed data to its binary cache or to its CSV file"""
+    if use_binary_cache == True:
+        common.commit_to_cache(df, file_type, is_orig_problem, generating_constants, dir_path=dir_path, columns=columns)
+    else:
+        common.commit_to_csv(df, file_type, is_orig_problem, dir_path=dir_path, generating_constants=generating_constants)
+
+def get_stale_stages(header, generating_constants):
+    """The stages whose constants changed since the data was generated; all of them if its fingerprints are unknown"""
+    if header is None or "fingerprints" not in header: return list(generating_constants)
+    fingerprints = common.get_fingerprints(generating_constants)
+    return [stage for stage in fingerprints if header["fingerprints"].get(stage) != fingerprints[stage]]
+
+def reuse_data(file_type, is_orig_problem, dir_path, use_binary_cache, generating_constants, update_rewards, reward_columns):
+    """
+    Load pre-processed data if it was generated from the current constants. If only the constants of the
+    rewards stage changed, just the reward_columns are recomputed (by update_rewards) and committed.
+    Returns an empty dataframe if the data has to be created from scratch.
+    """
+    df, header, from_csv = load_data(file_type, is_orig_problem, dir_path, use_binary_cache)
+    if df.empty: return df
+    
+    stale_stages = get_stale_stages(header, generating_constants)
+    if constants.STAGE_TRANSITIONS in stale_stages:
+        print("Cached " + file_type.name + " data was generated from other constants, will compute and create it instead.")
+        return pd.DataFrame()
+    if constants.STAGE_REWARDS in stale_stages:
+        print("Cached " + file_type.name + " data was generated from other reward/fee constants, will recompute these.")
+        df = update_rewards(df, is_orig_problem)
+    if from_csv == True and use_binary_cache == True:
+        # carry CSV data over into the binary cache for the next run
+        commit_data(df, file_type, is_orig_problem, dir_path, use_binary_cache, generating_constants)
+    elif len(stale_stages) > 0:
+        commit_data(df, file_type, is_orig_problem, dir_path, use_binary_cache, generating_constants, columns=reward_columns)
+    return df
+
 def run():
     # the following will grab the values either from overrules or from the module itself
     is_orig_problem = constants.IS_ORIGINAL_PROBLEM
@@ -10,32 +57,48 @@ def run():
     use_csv_data = constants.GET_DATA_FROM_CSV
     use_csv_model = constants.GET_MODEL_FROM_CSV
     dir_path = constants.PATH_SPRENRET_CSV
+    use_binary_cache = constants.USE_BINARY_CACHE
     pi_seq_nr = constants.PI_SEQ_NR
     v_seq_nr = constants.V_SEQ_NR
+    use_model = constants.USE_TRANSITION_MODEL
+    factorize_model = constants.FACTORIZE_TRANSITION_MODEL
+    solver = constants.SOLVER
+    mpi_evaluation_sweeps = constants.MPI_EVALUATION_SWEEPS
     
     # initialize the four dataframes as empty dataframes, and use
     # if dataframe.empty() to check if data could be loaded from file
     dfSASP, dfSp_Ren_Ret, dfPi, dfV = pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
     # Pre-process from scratch, or get pre-processed data from CSV files
     create_dfSASP, create_dfSp_Ren_Ret = False, False
+    # the factorized model is built from the constants instead of dfSp_Ren_Ret
+    need_dfSp_Ren_Ret = not (use_model == True and factorize_model == True)
     if disk_allowed == True and use_csv_data == True:
         # get cached pre-processed data from disk
-        dfSASP = common.load_from_csv(common.FileType.SASP, is_orig_problem, dir_path=dir_path)
-        dfSp_Ren_Ret = common.load_from_csv(common.FileType.Sp_Ren_Ret, is_orig_problem, dir_path=dir_path)
+        # (reused only if generated from the current constants)
+        dfSASP = reuse_data(common.FileType.SASP, is_orig_problem, dir_path, use_binary_cache,
+                            preprocess.get_dfSASP_constants(is_orig_problem), 
+                            preprocess.update_dfSASP_fees, [constants.DFCOL_SASP_FEES])
+        if need_dfSp_Ren_Ret == True:
+            dfSp_Ren_Ret = reuse_data(common.FileType.Sp_Ren_Ret, is_orig_problem, dir_path, use_binary_cache,
+                                      preprocess.get_dfSpRenRet_constants(is_orig_problem), 
+                                      preprocess.update_dfSpRenRet_rewards, 
+                                      [constants.DFCOL_SPRENRET_REWARD, constants.DFCOL_SPRENRET_FEES])
         # if any of the files couldn't be found or accessed 
         if dfSASP.empty: create_dfSASP = True
-        if dfSp_Ren_Ret.empty: create_dfSp_Ren_Ret = True
+        if dfSp_Ren_Ret.empty: create_dfSp_Ren_Ret = need_dfSp_Ren_Ret
     elif disk_allowed == True and use_csv_data == False:
-        create_dfSASP, create_dfSp_Ren_Ret = True, True
+        create_dfSASP, create_dfSp_Ren_Ret = True, need_dfSp_Ren_Ret
         
     if create_dfSASP == True:
         dfSASP = preprocess.prep_dfSASP(is_orig_problem)
         if disk_allowed == True: 
-            common.commit_to_csv(dfSASP, common.FileType.SASP, is_orig_problem, dir_path=dir_path)
+            commit_data(dfSASP, common.FileType.SASP, is_orig_problem, dir_path, use_binary_cache,
+                        preprocess.get_dfSASP_constants(is_orig_problem))
     if create_dfSp_Ren_Ret == True:
         dfSp_Ren_Ret = preprocess.prep_dfSpRenRet(is_orig_problem)
         if disk_allowed == True:
-            common.commit_to_csv(dfSp_Ren_Ret, common.FileType.Sp_Ren_Ret, is_orig_problem, dir_path=dir_path)   
+            commit_data(dfSp_Ren_Ret, common.FileType.Sp_Ren_Ret, is_orig_problem, dir_path, use_binary_cache,
+                        preprocess.get_dfSpRenRet_constants(is_orig_problem))   
         
     # Compute policy and value function (Policy Iteration)
     if disk_allowed == True and use_csv_model == True:
@@ -50,9 +113,15 @@ def run():
         pi_seq_nr, v_seq_nr = -1, -1
     
     if pi_seq_nr == -1 or v_seq_nr == -1:
-        dfPi, dfV = compute.policy_iteration(
-            dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=pi_seq_nr, v_seq_nr=v_seq_nr, 
-            disk_allowed=disk_allowed, dir_path=dir_path)
+        if use_model == True:
+            dfPi, dfV = compute.model_policy_iteration(
+                dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=pi_seq_nr, v_seq_nr=v_seq_nr, 
+                disk_allowed=disk_allowed, dir_path=dir_path, factorized=factorize_model, 
+                solver=solver, mpi_evaluation_sweeps=mpi_evaluation_sweeps)
+        else:
+            dfPi, dfV = compute.policy_iteration(
+                dfSASP, dfSp_Ren_Ret, is_orig_problem, pi_seq_nr=pi_seq_nr, v_seq_nr=v_seq_nr, 
+                disk_allowed=disk_allowed, dir_path=dir_path)
         
     dfV_pivoted, dfPi_s_pivoted = postprocess.transform_data(dfPi, dfV)
     plot.plot_V(dfV_pivoted)